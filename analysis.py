@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from google.genai import types
+
+from keypool import is_rate_limit, retry_delay
+
+# --- 🧐 FILE ANALYSIS ---
+# Map-reduce over the whole script: it is cut into chunks at line boundaries,
+# the chunks are summarised concurrently, and one streamed request reduces the
+# summaries into the context block the translator sees. Results are cached on
+# disk by script + settings hash. With a series name set, each analysed episode
+# is folded into rolling series notes that the next episode's reduce builds on.
+
+ANALYSIS_DIR = "analysis_cache"
+ANALYSIS_CHUNK = 24000        # script characters per map request
+SERIES_NOTES_MAX = 6000       # characters of series notes carried forward
+
+def chunk_script(lines, size=ANALYSIS_CHUNK):
+    chunks = []; cur = []; n = 0
+    for x in lines:
+        row = f"{x.id}: {x.txt}"
+        if cur and n + len(row) > size: chunks.append("\n".join(cur)); cur = []; n = 0
+        cur.append(row); n += len(row) + 1
+    if cur: chunks.append("\n".join(cur))
+    return chunks
+
+def analysis_key(settings, lines, glossary_text):
+    h = hashlib.sha1()
+    for part in (settings['model_name'], settings['source_lang'], settings['target_lang'], settings.get('analysis_instr', ""), glossary_text):
+        h.update(part.encode('utf-8')); h.update(b"\0")
+    for x in lines: h.update(f"{x.id}\0{x.txt}\0".encode('utf-8'))
+    return h.hexdigest()
+
+def _slug(name): return re.sub(r'[^\w-]+', '_', name.strip().lower())[:60]
+
+class AnalysisCache:
+    """JSON files under `directory`: one per analysed script, one per series."""
+    def __init__(self, directory=ANALYSIS_DIR):
+        self.dir = directory; os.makedirs(directory, exist_ok=True)
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.dir, name), "r", encoding="utf-8") as fh: return json.load(fh)
+        except (OSError, ValueError): return None
+
+    def _write(self, name, data):
+        path = os.path.join(self.dir, name); tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh: json.dump(data, fh, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        hit = self._read(f"{key}.json")
+        return hit['text'] if hit else None
+    def put(self, key, text): self._write(f"{key}.json", {'text': text, 'ts': time.time()})
+
+    def series(self, name): return self._read(f"series_{_slug(name)}.json") or {'notes': "", 'episodes': []}
+    def put_series(self, name, data): self._write(f"series_{_slug(name)}.json", data)
+
+async def _map_chunks(client, settings, chunks, glossary_text, note, tel):
+    sem = asyncio.Semaphore(max(1, settings.get('concurrency', 4))); config = types.GenerateContentConfig(temperature=0.3)
+    async def one(i, chunk):
+        prompt = (f"ANALYZE PART {i + 1}/{len(chunks)} of a subtitle script ({settings['source_lang']} -> {settings['target_lang']}).\n"
+                  f"Summarise briefly: plot beats, characters (names, gender, how they address each other), tone, recurring terms.{note}\n{glossary_text}\nInput:\n{chunk}")
+        async with sem:
+            for attempt in range(3):
+                t0 = time.monotonic()
+                try:
+                    resp = await client.aio.models.generate_content(model=settings['model_name'], contents=prompt, config=config)
+                    tel(f"map {i + 1}/{len(chunks)}", t0, None, resp.usage_metadata, 'ok', attempt)
+                    return resp.text or ""
+                except Exception as e:
+                    tel(f"map {i + 1}/{len(chunks)}", t0, None, None, '429' if is_rate_limit(e) else 'error', attempt)
+                    if not is_rate_limit(e) or attempt == 2: raise
+                    d = retry_delay(e); await asyncio.sleep(5 * (attempt + 1) if d is None else d)
+    # Client.__exit__ only closes the sync transport, so the async one is closed here, inside the loop that opened it.
+    try: return await asyncio.gather(*[one(i, c) for i, c in enumerate(chunks)])
+    finally: await client.aio.aclose()
+
+def _stream(client, settings, prompt, on_delta, tel, label):
+    parts = []; t0 = time.monotonic(); t_first = None; usage = None
+    try:
+        for chunk in client.models.generate_content_stream(model=settings['model_name'], contents=prompt, config=types.GenerateContentConfig(temperature=0.3)):
+            if t_first is None: t_first = time.monotonic()
+            if chunk.usage_metadata: usage = chunk.usage_metadata
+            if chunk.text:
+                parts.append(chunk.text)
+                if on_delta: on_delta(chunk.text)
+    except Exception as e: tel(label, t0, t_first, usage, '429' if is_rate_limit(e) else 'error', 0); raise
+    tel(label, t0, t_first, usage, 'ok', 0)
+    return "".join(parts)
+
+def analyze(client_factory, settings, lines, glossary_text, on_delta=None, cache=None, telemetry=None, name=""):
+    """Context block for the whole script. `client_factory()` gives a fresh client per call: google-genai binds a client's
+    `aio` surface to the first event loop it runs in, so one client must not serve two asyncio.run() calls. `cache` (an
+    AnalysisCache) skips work already done; with settings['series_name'] set, earlier episodes' notes feed the reduce and
+    this episode is added to them."""
+    def tel(label, t0, t_first, usage, status, attempt):
+        if telemetry: telemetry.record('analysis', name, label, t0, t_first, usage, status=status, attempt=attempt)
+    key = analysis_key(settings, lines, glossary_text); series = (settings.get('series_name') or "").strip()
+    hit = cache.get(key) if cache else None
+    if hit:
+        if on_delta: on_delta(hit)
+        return hit
+    notes = cache.series(series) if cache and series else {'notes': "", 'episodes': []}
+    series_block = f"\n[SERIES NOTES FROM EARLIER EPISODES]:\n{notes['notes']}\n" if notes['notes'] else ""
+    chunks = chunk_script(lines); note = f"\nNOTE: {settings['analysis_instr']}" if settings.get('analysis_instr') else ""
+    with client_factory() as client:
+        if len(chunks) <= 1:
+            text = _stream(client, settings, f"ANALYZE ({len(lines)} lines). Genre, Tone, Characters.{note}\n{glossary_text}{series_block}\nInput:\n{chunks[0] if chunks else ''}", on_delta, tel, "analyze")
+        else:
+            summaries = asyncio.run(_map_chunks(client, settings, chunks, glossary_text, note, tel))
+            joined = "\n\n".join(f"[PART {i + 1}/{len(chunks)}]\n{s}" for i, s in enumerate(summaries))
+            text = _stream(client, settings, f"MERGE these partial analyses of one {len(lines)}-line script into a single context block for a translator: Genre, Tone, Characters (names, gender, relationships, forms of address), recurring terms. Resolve contradictions in favour of later parts.{note}\n{glossary_text}{series_block}\n{joined}", on_delta, tel, "reduce")
+        if cache and text:
+            cache.put(key, text)
+            if series and key not in notes['episodes']:
+                try:
+                    if notes['notes']:
+                        t0 = time.monotonic(); resp = client.models.generate_content(model=settings['model_name'], contents=f"UPDATE the series notes with this episode's analysis. Keep stable facts (characters, relationships, terms), drop one-off plot detail. Max {SERIES_NOTES_MAX // 5} words.\n\n[SERIES NOTES]:\n{notes['notes']}\n\n[NEW EPISODE]:\n{text}", config=types.GenerateContentConfig(temperature=0.2))
+                        tel("series notes", t0, None, resp.usage_metadata, 'ok', 0)
+                        notes['notes'] = (resp.text or notes['notes'])[:SERIES_NOTES_MAX]
+                    else: notes['notes'] = text[:SERIES_NOTES_MAX]
+                    notes['episodes'].append(key); cache.put_series(series, notes)
+                except Exception: pass   # the episode analysis itself is still good; notes catch up next time
+    return text
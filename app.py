@@ -1,15 +1,22 @@
 import streamlit as st
-import re
 import os
 import time
 import json
-import zipfile
-import io
+import asyncio
 from google import genai
-from google.genai import types
+from subtitles import load_subtitle, content_hash
+from exports import ExportCache, bump
+from engine import BatchFailed
+from keypool import QuotaExceeded, DEFAULT_RPM, DEFAULT_TPM
+from tmcache import TranslationMemory
+from pipeline import SETTINGS_FILE, new_job, analyze, revise, make_engine, fresh_clients
+from cueindex import CueIndex
+from glossary import GlossaryMatcher
+from analysis import AnalysisCache
+from telemetry import Telemetry
+from journal import JobJournal, job_key, prune as prune_journals
 
 # --- ⚙️ CONFIG & SETTINGS MANAGEMENT ---
-SETTINGS_FILE = "gemini_settings.json"
 
 def load_settings():
     if os.path.exists(SETTINGS_FILE):
@@ -22,7 +29,7 @@ def load_settings():
                     st.session_state[f"saved_{k}"] = v
         except: pass
 
-def save_current_settings(model, src, tgt, batch, temp, tok, mem, ana, rev, u_prompt, a_prompt, r_prompt):
+def save_current_settings(model, src, tgt, batch, temp, tok, mem, ana, rev, u_prompt, a_prompt, r_prompt, conc, rpm, tpm, tm_on, dedup, dedup_short, adaptive, series, prompt_cache_on, structured, scene_gap, hedging, hedge_pct, fallback):
     data = {
         "api_keys": st.session_state.api_keys,
         "active_key": st.session_state.active_key,
@@ -37,7 +44,21 @@ def save_current_settings(model, src, tgt, batch, temp, tok, mem, ana, rev, u_pr
         "enable_revision": rev,
         "user_instr": u_prompt,
         "analysis_instr": a_prompt,
-        "revision_instr": r_prompt
+        "revision_instr": r_prompt,
+        "concurrency": conc,
+        "key_rpm": rpm,
+        "key_tpm": tpm,
+        "enable_tm": tm_on,
+        "enable_dedup": dedup,
+        "dedup_keep_short": dedup_short,
+        "adaptive_batch": adaptive,
+        "series_name": series,
+        "enable_prompt_cache": prompt_cache_on,
+        "structured_output": structured,
+        "scene_gap": scene_gap,
+        "enable_hedging": hedging,
+        "hedge_pct": hedge_pct,
+        "fallback_model": fallback
     }
     with open(SETTINGS_FILE, "w") as f:
         json.dump(data, f)
@@ -55,6 +76,11 @@ if 'file_edits' not in st.session_state: st.session_state.file_edits = {}
 if 'job_progress' not in st.session_state: st.session_state.job_progress = {}
 if 'glossary' not in st.session_state: st.session_state.glossary = [] 
 if 'edit_index' not in st.session_state: st.session_state.edit_index = None 
+if 'key_limits' not in st.session_state: st.session_state.key_limits = {}
+if 'exports' not in st.session_state: st.session_state.exports = ExportCache()
+if 'last_telemetry' not in st.session_state: st.session_state.last_telemetry = None
+if 'editor_index' not in st.session_state: st.session_state.editor_index = {}; st.session_state.editor_gen = 0
+if 'restored_jobs' not in st.session_state: st.session_state.restored_jobs = {}   # file name -> journal key it was restored from
 
 if 'settings_loaded' not in st.session_state:
     load_settings()
@@ -83,9 +109,12 @@ with st.sidebar:
     if uploaded_files:
         current_filenames = [f.name for f in uploaded_files]
         progress_keys = list(st.session_state.job_progress.keys())
+        # Dropped jobs stay in their on-disk journals and come back when the file is uploaded again.
         for key in progress_keys:
             if key not in current_filenames: del st.session_state.job_progress[key]
-    else: st.session_state.job_progress = {}
+        st.session_state.exports.forget(current_filenames)
+        for key in [k for k in st.session_state.editor_index if k[0] not in current_filenames]: del st.session_state.editor_index[key]
+    else: st.session_state.job_progress = {}; st.session_state.exports = ExportCache(); st.session_state.editor_index = {}
     if st.session_state.skipped_files:
         st.warning(f"⏩ Skipped: {len(st.session_state.skipped_files)}")
         if st.button("Clear History"): st.session_state.skipped_files = []; st.rerun()
@@ -93,56 +122,23 @@ with st.sidebar:
 # --- 🖥️ MAIN INTERFACE ---
 st.markdown("### ✨ Gemini Subtitle Translator & Polisher")
 
-# --- PROCESSOR CLASS ---
-class SubtitleProcessor:
-    def __init__(self, filename, content_bytes):
-        self.ext = os.path.splitext(filename)[1].lower()
-        try: self.raw = content_bytes.decode('utf-8').replace('\r\n', '\n')
-        except: self.raw = content_bytes.decode('latin-1').replace('\r\n', '\n')
-        self.lines = []
-    def parse(self):
-        if self.ext == '.srt': self.srt()
-        elif self.ext == '.vtt': self.vtt()
-        elif self.ext == '.ass': self.ass()
-        return len(self.lines)
-    def srt(self):
-        for b in re.split(r'\n\s*\n', self.raw.strip()):
-            l = b.split('\n');
-            if len(l)>=3: self.lines.append({'id':l[0].strip(), 't':l[1].strip(), 'txt':"\n".join(l[2:])})
-    def vtt(self):
-        c={'id':None,'t':None,'txt':[]}; cnt=1; lines=self.raw.split('\n')
-        if lines and lines[0].strip()=="WEBVTT": lines=lines[1:]
-        for l in lines:
-            l=l.strip()
-            if "-->" in l: c['t']=l; c['id']=str(cnt); cnt+=1
-            elif l=="" and c['t']:
-                if c['txt']: self.lines.append(c.copy())
-                c={'id':None,'t':None,'txt':[]}
-            elif c['t']: c['txt'].append(l)
-        if c['t'] and c['txt']: self.lines.append(c)
-        for x in self.lines: x['txt']="\n".join(x['txt'])
-    def ass(self):
-        cnt=1
-        for l in self.raw.split('\n'):
-            if l.startswith("Dialogue:"):
-                p=l.split(',',9);
-                if len(p)==10: self.lines.append({'id':str(cnt),'raw':l,'txt':p[9].strip()}); cnt+=1
-    def get_output(self, data):
-        output = ""
-        if self.ext=='.srt':
-            for x in self.lines: output+=f"{x['id']}\n{x['t']}\n{data.get(x['id'],x['txt'])}\n\n"
-        elif self.ext=='.vtt':
-            output+="WEBVTT\n\n";
-            for x in self.lines: output+=f"{x['t']}\n{data.get(x['id'],x['txt'])}\n\n"
-        elif self.ext=='.ass':
-            cnt=1
-            for l in self.raw.split('\n'):
-                if l.startswith("Dialogue:"):
-                    p=l.split(',',9)
-                    if len(p)==10: output+=",".join(p[:9])+","+data.get(str(cnt),p[9].strip())+"\n"; cnt+=1
-                    else: output+=l+"\n"
-                else: output+=l+"\n"
-        return output
+# --- 📺 LIVE CONSOLE ---
+class LiveConsole:
+    # Collects streamed deltas and repaints the console at most `fps` times a second,
+    # showing only the tail of the active stream instead of re-sending everything.
+    def __init__(self, box, fps=4, tail=3000):
+        self.box = box; self.interval = 1.0 / fps; self.tail = tail; self.last = 0.0
+        self.parts = {}; self.titles = {}; self.fenced = {}; self.key = None
+    def write(self, key, title, delta, fence=True):
+        self.parts.setdefault(key, []).append(delta); self.titles[key] = title; self.fenced[key] = fence; self.key = key
+        if time.monotonic() - self.last >= self.interval: self.flush()
+    def flush(self):
+        if self.key not in self.parts: return
+        text = "".join(self.parts[self.key]); self.parts[self.key] = [text]; text = text[-self.tail:]
+        body = f"```text\n{text}\n```" if self.fenced[self.key] else text
+        self.box.markdown(f"**{self.titles[self.key]}**\n\n{body}"); self.last = time.monotonic()
+    def done(self, key):
+        self.parts.pop(key, None); self.titles.pop(key, None); self.fenced.pop(key, None)
 
 # --- 1. API CONFIGURATION ---
 with st.expander("🛠️ API Configuration & Keys", expanded=False):
@@ -188,11 +184,28 @@ with st.expander("🛠️ API Configuration & Keys", expanded=False):
             c_a1, c_a2, c_a3 = st.columns(3)
             def_temp = st.session_state.get('saved_temp_val', 0.3)
             def_tok = st.session_state.get('saved_max_tok_val', 65536)
-            with c_a1: enable_cooldown = st.checkbox("Smart Cooldown", value=True)
-            with c_a2: temp_val = st.slider("Temperature", 0.0, 2.0, def_temp)
-            with c_a3: max_tok_val = st.number_input("Max Output Tokens", 100, 65536, def_tok)
-            delay_ms = 500
-    else: enable_cooldown=True; temp_val=0.3; max_tok_val=65536; delay_ms=500
+            def_conc = st.session_state.get('saved_concurrency', 4)
+            def_rpm = st.session_state.get('saved_key_rpm', DEFAULT_RPM)
+            def_tpm = st.session_state.get('saved_key_tpm', DEFAULT_TPM)
+            with c_a1: temp_val = st.slider("Temperature", 0.0, 2.0, def_temp)
+            with c_a2: max_tok_val = st.number_input("Max Output Tokens", 100, 65536, def_tok)
+            with c_a3: concurrency = st.number_input("Parallel Requests", 1, 32, def_conc, help="Batches kept in flight across all files")
+            c_a4, c_a5, c_a6 = st.columns(3)
+            with c_a4: key_rpm = st.number_input("RPM / Key", 1, 10000, def_rpm, help="Starting requests-per-minute budget for each key. Lowered automatically on 429.")
+            with c_a5: key_tpm = st.number_input("TPM / Key", 1000, 100_000_000, def_tpm, step=10000, help="Starting tokens-per-minute budget for each key.")
+            with c_a6:
+                if st.button("Reset Learned Limits", use_container_width=True): st.session_state.key_limits = {}; st.toast("Key limits reset.")
+            prompt_cache_on = st.checkbox("🧊 Cache prompt prefix", value=st.session_state.get('saved_enable_prompt_cache', True), help="Register each file's context, glossary and instructions once per key as cached content; batches then send only their cues. Falls back to full prompts when the prefix is too small or caching fails.")
+            structured_on = st.checkbox("🧾 Structured output (JSON)", value=st.session_state.get('saved_structured_output', False), help="Ask the model for a JSON array of {id, text} via a response schema instead of [ID] blocks. Immune to brackets and commentary inside cues; replies that ignore it are still read the legacy way.")
+            c_a7, c_a8, c_a9 = st.columns(3)
+            with c_a7: hedging_on = st.checkbox("🪁 Hedge slow batches", value=st.session_state.get('saved_enable_hedging', False), help="When a batch runs longer than the chosen percentile of this run's batches, send a duplicate on another key. The first complete answer wins; the other is cancelled.")
+            with c_a8: hedge_pct = st.slider("Hedge after percentile", 0.5, 0.99, float(st.session_state.get('saved_hedge_pct', 0.95)), disabled=not hedging_on)
+            with c_a9: fallback_model = st.text_input("Fallback model", st.session_state.get('saved_fallback_model', ""), placeholder="e.g. gemini-2.5-pro", help="Batches that keep failing to parse, keep dropping cues or keep hitting quota move to this model instead of stopping the run. Empty = stop as before.")
+    else:
+        temp_val=0.3; max_tok_val=65536; concurrency=st.session_state.get('saved_concurrency', 4)
+        key_rpm=st.session_state.get('saved_key_rpm', DEFAULT_RPM); key_tpm=st.session_state.get('saved_key_tpm', DEFAULT_TPM)
+        prompt_cache_on=st.session_state.get('saved_enable_prompt_cache', True); structured_on=st.session_state.get('saved_structured_output', False)
+        hedging_on=st.session_state.get('saved_enable_hedging', False); hedge_pct=st.session_state.get('saved_hedge_pct', 0.95); fallback_model=st.session_state.get('saved_fallback_model', "")
 
 # --- 2. 📚 GLOSSARY ---
 with st.expander("📚 Words Menu (Glossary)", expanded=False):
@@ -247,6 +260,38 @@ with st.expander("📚 Words Menu (Glossary)", expanded=False):
                 st.warning("Delete from here to import words")
 
 # --- 3. 📝 SMART FILE EDITOR (DUAL MODE) ---
+# Paginated view over a CueIndex; each cue is its own widget and saves only itself.
+EDITOR_PAGE_SIZES = [25, 50, 100]
+
+def editor_index(fname, mode, sig, ids, texts):
+    # One index per (file, mode), rebuilt only when `sig` changes (new content, or the job changed outside the editor).
+    cached = st.session_state.editor_index.get((fname, mode))
+    if cached and cached[0] == sig: return cached[1], cached[2]
+    st.session_state.editor_gen += 1; idx = CueIndex(ids, texts)
+    st.session_state.editor_index[(fname, mode)] = (sig, idx, st.session_state.editor_gen)
+    return idx, st.session_state.editor_gen
+
+def save_cue(fname, mode, vid, widget_key, original=""):
+    # An emptied cue is un-translated (and journaled as such) in trans mode, and back to `original` in source mode.
+    txt = st.session_state[widget_key].strip(); sig, idx, gen = st.session_state.editor_index[(fname, mode)]
+    if mode == 'trans':
+        job = st.session_state.job_progress[fname]
+        if txt: job['trans_map'][vid] = txt; job['done_ids'].add(vid)
+        else: job['trans_map'].pop(vid, None); job['done_ids'].discard(vid)
+        bump(job); st.session_state.editor_index[(fname, mode)] = ((sig[0], job['rev']), idx, gen)
+        if job.get('journal_key'):
+            jr = JobJournal(job['journal_key'])
+            if txt: jr.revision({vid: txt})
+            else: jr.drop([vid])
+            jr.close()
+    else:
+        edits = st.session_state.file_edits.setdefault(fname, {})
+        if txt: edits[vid] = txt
+        else:
+            edits.pop(vid, None); txt = original
+            st.session_state.editor_gen += 1; st.session_state.editor_index[(fname, mode)] = (sig, idx, st.session_state.editor_gen)   # new widget keys show the restored text
+    idx.update(vid, txt)
+
 with st.expander("📝 File Editor (Original & Translated)", expanded=True):
     if not uploaded_files:
         st.info("⚠️ Please upload files in the sidebar first.")
@@ -256,74 +301,46 @@ with st.expander("📝 File Editor (Original & Translated)", expanded=True):
         current_file_obj = next((f for f in uploaded_files if f.name == selected_file_name), None)
         
         if current_file_obj:
-            temp_proc = SubtitleProcessor(selected_file_name, current_file_obj.getvalue()); temp_proc.parse()
-            is_translated = False; translated_content = ""
-            
-            if selected_file_name in st.session_state.job_progress:
-                job = st.session_state.job_progress[selected_file_name]
-                if 'trans_map' in job and job['trans_map']:
-                    is_translated = True
-                    sorted_ids = sorted(job['trans_map'].keys(), key=lambda x: int(x) if x.isdigit() else x)
-                    translated_content = "\n\n".join([f"[{vid}]\n{job['trans_map'][vid]}" for vid in sorted_ids])
+            raw = current_file_obj.getvalue(); temp_proc = load_subtitle(selected_file_name, raw); c_hash = content_hash(raw)
+            line_ids = [x.id for x in temp_proc.lines]
+            orig_texts = {x.id: x.txt for x in temp_proc.lines}; src_texts = dict(orig_texts); src_texts.update(st.session_state.file_edits.get(selected_file_name, {}))
+            src_idx, src_gen = editor_index(selected_file_name, 'src', (c_hash,), line_ids, src_texts)
+            job = st.session_state.job_progress.get(selected_file_name)
+            is_translated = bool(job and job.get('trans_map'))
 
             if is_translated:
                 st.success(f"✅ Editing: {selected_file_name} (Translated)")
-                col_orig, col_trans = st.columns(2)
-                
-                with col_orig:
-                    st.markdown("**Original (Preview)**")
-                    orig_text = "\n\n".join([f"[{line['id']}]\n{line['txt']}" for line in temp_proc.lines])
-                    st.text_area("Original", value=orig_text, height=350, disabled=True, key=f"orig_view_{selected_file_name}")
-                
-                with col_trans:
-                    st.markdown("**Translated (Editable)**")
-                    c_search1, c_search2 = st.columns([0.8, 0.2])
-                    search_query = c_search1.text_input("Find text...", label_visibility="collapsed", placeholder="Find text...", key=f"search_trans_{selected_file_name}")
-                    is_non_roman = c_search2.checkbox("Non-Roman", key=f"nr_trans_{selected_file_name}")
-                    
-                    if search_query or is_non_roman:
-                        found_lines = []
-                        matches = list(re.finditer(r'\[(\d+)\]\s*(?:^|\n|\s+)(.*?)(?=\n\[\d+\]|$)', translated_content, re.DOTALL))
-                        for m in matches:
-                            lid = m.group(1); txt = m.group(2).strip(); match_found = False
-                            if search_query and search_query.lower() in txt.lower(): match_found = True
-                            if is_non_roman:
-                                clean_txt = re.sub(r'[^\w\s]', '', txt)
-                                if re.search(r'[^\x00-\x7F]', clean_txt): match_found = True
-                            if match_found: found_lines.append(lid)
-                        st.caption(f"🔍 Found: {', '.join(found_lines[:20])}..." if found_lines else "🔍 No matches.")
-
-                    new_trans_text = st.text_area("Edit Translation", value=translated_content, height=280, key=f"trans_edit_{selected_file_name}", label_visibility="collapsed")
-                    
-                    if new_trans_text != translated_content:
-                        new_map = {}
-                        matches = list(re.finditer(r'\[(\d+)\]\s*(?:^|\n|\s+)(.*?)(?=\n\[\d+\]|$)', new_trans_text, re.DOTALL))
-                        for m in matches: new_map[m.group(1).strip()] = m.group(2).strip()
-                        st.session_state.job_progress[selected_file_name]['trans_map'].update(new_map)
-                        st.toast("💾 Saved to Memory!", icon="✅"); time.sleep(1); st.rerun()
-            
+                mode = 'trans'; idx, gen = editor_index(selected_file_name, mode, (c_hash, job.get('rev', 0)), line_ids, job['trans_map'])
             else:
                 st.info(f"ℹ️ Editing Source: {selected_file_name}")
-                if selected_file_name in st.session_state.file_edits: display_content = st.session_state.file_edits[selected_file_name]
-                else: display_content = "\n\n".join([f"[{line['id']}]\n{line['txt']}" for line in temp_proc.lines])
-                
-                c_search1, c_search2 = st.columns([0.8, 0.2])
-                search_query = c_search1.text_input("Find text...", label_visibility="collapsed", placeholder="Find text...", key=f"search_src_{selected_file_name}")
-                is_non_roman = c_search2.checkbox("Non-Roman", key=f"nr_src_{selected_file_name}")
-                if search_query or is_non_roman:
-                    found_lines = []
-                    matches = list(re.finditer(r'\[(\d+)\]\s*(?:^|\n|\s+)(.*?)(?=\n\[\d+\]|$)', display_content, re.DOTALL))
-                    for m in matches:
-                        lid = m.group(1); txt = m.group(2).strip(); match_found = False
-                        if search_query and search_query.lower() in txt.lower(): match_found = True
-                        if is_non_roman:
-                            clean_txt = re.sub(r'[^\w\s]', '', txt)
-                            if re.search(r'[^\x00-\x7F]', clean_txt): match_found = True
-                        if match_found: found_lines.append(lid)
-                    st.caption(f"🔍 Found: {', '.join(found_lines[:20])}..." if found_lines else "🔍 No matches.")
-                
-                edited_content = st.text_area(f"Edit Source", value=display_content, height=350, key=f"editor_{selected_file_name}")
-                if edited_content != display_content: st.session_state.file_edits[selected_file_name] = edited_content; st.success("✅ Source Updated!")
+                mode = 'src'; idx, gen = src_idx, src_gen
+
+            c_search1, c_search2, c_jump, c_psize = st.columns([0.45, 0.15, 0.2, 0.2])
+            search_query = c_search1.text_input("Find text...", label_visibility="collapsed", placeholder="Find text...", key=f"search_{mode}_{selected_file_name}")
+            is_non_roman = c_search2.checkbox("Non-Roman", key=f"nr_{mode}_{selected_file_name}")
+            jump_id = c_jump.text_input("Jump to ID", label_visibility="collapsed", placeholder="Jump to ID", key=f"jump_{mode}_{selected_file_name}").strip()
+            page_size = c_psize.selectbox("Cues per page", EDITOR_PAGE_SIZES, index=1, label_visibility="collapsed", key=f"psize_{selected_file_name}")
+
+            shown = idx.filter(search_query, is_non_roman)
+            if search_query or is_non_roman: st.caption(f"🔍 Found: {len(shown)} cue(s)" if shown else "🔍 No matches.")
+            pages = max(1, -(-len(shown) // page_size)); page_key = f"page_{mode}_{selected_file_name}"
+            if jump_id and jump_id != st.session_state.get(f"{page_key}_jump"):
+                st.session_state[f"{page_key}_jump"] = jump_id; target = CueIndex.page_of(shown, jump_id, page_size)
+                if target: st.session_state[page_key] = target
+                else: st.warning(f"ID {jump_id} is not in the current view.")
+            if st.session_state.get(page_key, 1) > pages: st.session_state[page_key] = pages
+            page = st.number_input(f"Page (of {pages})", 1, pages, key=page_key)
+
+            with st.container(height=520, border=True):
+                for vid in shown[(page - 1) * page_size : page * page_size]:
+                    w_key = f"cue_{mode}_{selected_file_name}_{gen}_{vid}"
+                    if mode == 'trans':
+                        col_orig, col_trans = st.columns(2)
+                        col_orig.text(f"[{vid}] {src_idx.text.get(vid, '')}")
+                        col_trans.text_area(f"[{vid}]", value=idx.text[vid], height=68, key=w_key, label_visibility="collapsed", placeholder="(untranslated)",
+                                            on_change=save_cue, args=(selected_file_name, mode, vid, w_key))
+                    else:
+                        st.text_area(f"[{vid}]", value=idx.text[vid], height=68, key=w_key, on_change=save_cue, args=(selected_file_name, mode, vid, w_key, orig_texts.get(vid, "")))
 
 # --- 4. TRANSLATION SETTINGS ---
 with st.expander("⚙️ Translation Settings", expanded=False):
@@ -351,7 +368,11 @@ with st.expander("⚙️ Translation Settings", expanded=False):
         source_lang = st.text_input("SOURCE_LANGUAGE", def_src)
     with col2:
         target_lang = st.text_input("TARGET_LANGUAGE", def_tgt)
-        batch_sz = st.number_input("BATCH_SIZE", 1, 500, def_batch)
+        batch_sz = st.number_input("BATCH_SIZE", 1, 500, def_batch, help="Cues per batch. With adaptive sizing this is the starting point; batches are also capped by an output-token budget.")
+        scene_gap = st.number_input("Scene gap (s)", 0.0, 60.0, float(st.session_state.get('saved_scene_gap', 2.5)), step=0.5, help="A silence this long starts a new scene. Batches take whole scenes and scenes translate in parallel, each with its own context. 0 = fixed slices of the file.")
+        adaptive_batch = st.checkbox("Adaptive batch size", value=st.session_state.get('saved_adaptive_batch', True), help="Grow batches while they return fast and clean, shrink them on truncation, errors or slow responses.")
+        enable_dedup = st.checkbox("Collapse duplicate cues", value=st.session_state.get('saved_enable_dedup', True), help="Send each repeated line once and copy its translation to every duplicate.")
+        dedup_keep_short = st.checkbox("Keep short exclamations context-sensitive", value=st.session_state.get('saved_dedup_keep_short', True), disabled=not enable_dedup, help="Lines of 1-2 words (\"Huh?\", \"Yes.\") are translated in place instead of collapsed.")
 
 # --- FEATURES & EXECUTION ---
 cs1, cs2 = st.columns([0.85, 0.15], vertical_alignment="bottom")
@@ -359,6 +380,7 @@ with cs1: st.markdown("### ⚡ Workflow Steps")
 def_mem = st.session_state.get('saved_enable_memory', True)
 def_ana = st.session_state.get('saved_enable_analysis', False)
 def_rev = st.session_state.get('saved_enable_revision', False)
+def_tm = st.session_state.get('saved_enable_tm', True)
 def_u_instr = st.session_state.get('saved_user_instr', "Translate into natural Roman Hindi. Keep Anime terms in English.")
 def_a_instr = st.session_state.get('saved_analysis_instr', "")
 def_r_instr = st.session_state.get('saved_revision_instr', "")
@@ -367,14 +389,50 @@ enable_memory = st.checkbox("🧠 1. Context Memory", value=def_mem)
 st.divider()
 enable_analysis = st.checkbox("🧐 2. Deep File Analysis", value=def_ana)
 analysis_instr = st.text_area("Analysis Note", value=def_a_instr, placeholder="Context...", height=68) if enable_analysis else ""
+series_name = st.text_input("Series name (optional)", value=st.session_state.get('saved_series_name', ""), placeholder="e.g. Frieren S1", help="Episodes with the same series name share rolling notes, so later episodes build on earlier analyses.") if enable_analysis else ""
 st.divider()
 enable_revision = st.checkbox("✨ 3. Revision / Polish", value=def_rev)
 revision_instr = st.text_area("Revision Note", value=def_r_instr, placeholder="Instructions...", height=68) if enable_revision else ""
+st.divider()
+tm1, tm2 = st.columns([0.85, 0.15], vertical_alignment="center")
+with tm1: enable_tm = st.checkbox("🗃️ 4. Translation Memory (reuse past translations)", value=def_tm)
+with tm2:
+    if st.button("Clear TM", use_container_width=True):
+        tm_db = TranslationMemory(); tm_db.clear(); tm_db.close(); st.toast("🗃️ Translation memory cleared.")
+if enable_tm:
+    tm_db = TranslationMemory(); tm_s = tm_db.stats(); tm_db.close()
+    st.caption(f"{tm_s['entries']:,} / {tm_s['max_entries']:,} entries · lifetime hit rate {tm_s['total_hit_rate']:.0%}")
 st.markdown("---")
 user_instr = st.text_area("USER_INSTRUCTION", value=def_u_instr)
 
 if cs2.button("💾 Save Settings", key="real_save_btn", help="Save ALL settings permanently", use_container_width=True):
-    save_current_settings(model_name, source_lang, target_lang, batch_sz, temp_val, max_tok_val, enable_memory, enable_analysis, enable_revision, user_instr, analysis_instr, revision_instr)
+    save_current_settings(model_name, source_lang, target_lang, batch_sz, temp_val, max_tok_val, enable_memory, enable_analysis, enable_revision, user_instr, analysis_instr, revision_instr, concurrency, key_rpm, key_tpm, enable_tm, enable_dedup, dedup_keep_short, adaptive_batch, series_name, prompt_cache_on, structured_on, scene_gap, hedging_on, hedge_pct, fallback_model)
+
+# --- 📓 RESUME FROM JOURNALS ---
+if 'journals_pruned' not in st.session_state: prune_journals(); st.session_state.journals_pruned = True
+run_settings = {'model_name': model_name, 'source_lang': source_lang, 'target_lang': target_lang, 'batch_sz': batch_sz, 'temp_val': temp_val, 'max_tok_val': max_tok_val,
+                'enable_memory': enable_memory, 'user_instr': user_instr, 'revision_instr': revision_instr, 'concurrency': concurrency, 'key_rpm': key_rpm, 'key_tpm': key_tpm,
+                'enable_tm': enable_tm, 'enable_dedup': enable_dedup, 'dedup_keep_short': dedup_keep_short, 'adaptive_batch': adaptive_batch,
+                'analysis_instr': analysis_instr, 'series_name': series_name, 'enable_prompt_cache': prompt_cache_on,
+                'structured_output': structured_on, 'scene_gap': scene_gap,
+                'enable_hedging': hedging_on, 'hedge_pct': hedge_pct, 'fallback_model': fallback_model}
+restored = []
+for f in uploaded_files or []:
+    if f.name in st.session_state.job_progress or f.name in st.session_state.skipped_files: continue
+    jr = JobJournal(job_key(content_hash(f.getvalue()), run_settings, st.session_state.glossary))
+    if jr.exists():
+        job = jr.replay(new_job()); job['journal_key'] = jr.key
+        if job['trans_map'] or job['analysis']:
+            st.session_state.job_progress[f.name] = job; st.session_state.restored_jobs[f.name] = jr.key; restored.append(f"{f.name} ({len(job['trans_map'])} cues)")
+if restored: st.toast(f"📓 Restored from journal: {', '.join(restored)}"); st.rerun()
+for fname, key in list(st.session_state.restored_jobs.items()):
+    job = st.session_state.job_progress.get(fname)
+    if not job or job.get('journal_key') != key: del st.session_state.restored_jobs[fname]; continue
+    c_info, c_discard = st.columns([0.7, 0.3])
+    c_info.caption(f"📓 {fname}: {len(job['trans_map'])} cue(s){' and the analysis' if job['analysis'] else ''} restored from its journal ({job['status']}).")
+    if c_discard.button("🗑️ Discard journal & start fresh", key=f"discard_{fname}", use_container_width=True):
+        JobJournal(key).discard(); del st.session_state.job_progress[fname]; del st.session_state.restored_jobs[fname]
+        st.session_state.exports.forget([n for n in st.session_state.exports.outputs if n != fname]); st.rerun()
 
 work_status = "new" 
 for f in uploaded_files:
@@ -389,146 +447,132 @@ if start_button:
     else:
         with st.spinner("🔄 Processing..."):
             try:
-                with genai.Client(api_key=st.session_state.active_key) as client:
-                    st.markdown("## Translation Status")
-                    st.markdown("---")
-                    file_status_ph = st.empty(); progress_text_ph = st.empty(); progress_bar = st.progress(0); token_stats_ph = st.empty()
-                    st.markdown("### Live Console:"); 
-                    with st.container(height=300, border=True): console_box = st.empty()
-                    total_session_tokens = 0
-                    glossary_text = ""
-                    if st.session_state.glossary:
-                        g_list = [f"- {item['src']} = {item['tgt']}" for item in st.session_state.glossary]
-                        glossary_text = "\n[STRICT GLOSSARY - MUST USE THESE TRANSLATIONS]:\n" + "\n".join(g_list) + "\n"
-
-                    for file_idx, uploaded_file in enumerate(uploaded_files):
-                        if uploaded_file.name in st.session_state.skipped_files: continue
-                        fname = uploaded_file.name
-                        if fname not in st.session_state.job_progress: st.session_state.job_progress[fname] = {'status': 'paused', 'done_ids': [], 'trans_map': {}, 'analysis': None}
-                        job = st.session_state.job_progress[fname]
-                        proc = SubtitleProcessor(fname, uploaded_file.getvalue()); proc.parse()
-                        
-                        if fname in st.session_state.file_edits:
-                            clean_edit_str = st.session_state.file_edits[fname]
-                            user_edit_map = {m.group(1).strip(): m.group(2).strip() for m in re.finditer(r'\[(.*?)\]\s*(?:^|\n|\s+)(.*?)(?=\n\[.*?\]|$)', clean_edit_str, re.DOTALL)}
-                            for line in proc.lines:
-                                if line['id'] in user_edit_map: line['txt'] = user_edit_map[line['id']]
+                st.markdown("## Translation Status")
+                st.markdown("---")
+                file_status_ph = st.empty(); progress_text_ph = st.empty(); progress_bar = st.progress(0); token_stats_ph = st.empty()
+                st.markdown("### Live Console:"); 
+                with st.container(height=300, border=True): console_box = st.empty()
+                live = LiveConsole(console_box)
+                glossary = GlossaryMatcher(st.session_state.glossary)
+                tel = st.session_state.last_telemetry = Telemetry()
+                new_client = fresh_clients(st.session_state.active_key)
+
+                # Prepare + Analysis (per file, before the shared translation run)
+                run_files = []
+                for file_idx, uploaded_file in enumerate(uploaded_files):
+                    if uploaded_file.name in st.session_state.skipped_files: continue
+                    fname = uploaded_file.name
+                    journal = JobJournal(job_key(content_hash(uploaded_file.getvalue()), run_settings, st.session_state.glossary))
+                    job = st.session_state.job_progress.get(fname)
+                    if not job or job.get('journal_key') != journal.key:
+                        # A session job made under other settings (target, model, glossary, ...) must not land in this journal.
+                        stale = job; job = st.session_state.job_progress[fname] = journal.replay(new_job()); job['journal_key'] = journal.key
+                        if stale: job['rev'] = stale.get('rev', 0); bump(job)   # its cached downloads are stale too
+                    proc = load_subtitle(fname, uploaded_file.getvalue()); file_lines = proc.lines
                         
-                        total_lines = len(proc.lines); file_status_ph.markdown(f"### 📂 File {file_idx+1}/{len(uploaded_files)}: **{fname}**")
+                    if fname in st.session_state.file_edits:
+                        file_lines = proc.with_edits(st.session_state.file_edits[fname])
                         
-                        # Analysis
-                        file_context_summary = "No analysis requested."
-                        if enable_analysis:
-                            if job['analysis']: file_context_summary = job['analysis']; console_box.info("🧠 Using Saved Analysis.")
-                            else:
-                                try:
-                                    console_box.info("🧠 Analyzing content...")
-                                    full_script = "\n".join([f"{x['id']}: {x['txt']}" for x in proc.lines])
-                                    ana_stream = client.models.generate_content_stream(model=model_name, contents=f"ANALYZE ({total_lines} lines). Genre, Tone, Characters.\n{glossary_text}\nInput:\n{full_script[:30000]}", config=types.GenerateContentConfig(temperature=0.3))
-                                    full_analysis_text = ""
-                                    for chunk in ana_stream:
-                                        if chunk.text: full_analysis_text += chunk.text; console_box.markdown(f"**Analyzing...**\n\n{full_analysis_text}")
-                                    file_context_summary = full_analysis_text; job['analysis'] = full_analysis_text; st.session_state.job_progress[fname] = job
-                                    console_box.success("✅ Analysis Complete!"); time.sleep(1)
-                                except Exception as e: console_box.error(f"⚠️ Analysis Failed: {e}"); file_context_summary = "Failed."
-
-                        # Translation
-                        trans_map = job['trans_map']; completed_set = set(job['done_ids'])
-                        progress_text_ph.text(f"✅ Completed: {len(completed_set)} / {total_lines}"); progress_bar.progress(len(completed_set) / total_lines)
-                        cooldown_hits = 0; 
+                    total_lines = len(file_lines); file_status_ph.markdown(f"### 📂 File {file_idx+1}/{len(uploaded_files)}: **{fname}**")
                         
-                        for i in range(0, total_lines, batch_sz):
-                            chunk = proc.lines[i : i + batch_sz]
-                            if all(x['id'] in completed_set for x in chunk): continue
-                            current_batch_num = (i // batch_sz) + 1
-                            batch_txt = "".join([f"[{x['id']}]\n{x['txt']}\n\n" for x in chunk])
-                            memory_block = ""
-                            if enable_memory and trans_map:
-                                sorted_keys = sorted(trans_map.keys(), key=lambda x: int(x) if x.isdigit() else x)
-                                if sorted_keys: memory_block = "\n[PREVIOUS CONTEXT]:\n" + "\n".join([f"[{k}] {trans_map[k]}" for k in sorted_keys[-3:]]) + "\n"
-
-                            prompt = f"""You are a professional translator.\nTASK: Translate {source_lang} to {target_lang}.\n[CONTEXT]: {file_context_summary}\n{glossary_text}\n{memory_block}\n[INSTRUCTIONS]: {user_instr}\n[FORMAT]:\n[ID]\nTranslated Text\n\n[INPUT]:\n{batch_txt}"""
-                            retry = 3; success = False
-                            while retry > 0:
-                                try:
-                                    if i > 0: time.sleep(delay_ms / 1000.0)
-                                    response_stream = client.models.generate_content_stream(model=model_name, contents=prompt, config=types.GenerateContentConfig(temperature=temp_val, max_output_tokens=max_tok_val))
-                                    full_resp = ""
-                                    batch_tokens = 0
-                                    for chunk_resp in response_stream:
-                                        if chunk_resp.text: full_resp += chunk_resp.text; console_box.markdown(f"**Translating Batch {current_batch_num}...**\n\n```text\n{full_resp}\n```")
-                                        if chunk_resp.usage_metadata: batch_tokens = chunk_resp.usage_metadata.total_token_count
-                                    total_session_tokens += batch_tokens
-                                    token_stats_ph.markdown(f"**Tokens (Batch):** `{batch_tokens}` | **Total:** `{total_session_tokens}`")
-
-                                    clean_text = full_resp.replace("```", "").replace("**", "")
-                                    matches = list(re.finditer(r'\[(\d+)\]\s*(?:^|\n|\s+)(.*?)(?=\n\[\d+\]|$)', clean_text, re.DOTALL))
-                                    if matches:
-                                        found_any = False
-                                        for m in matches: mid = m.group(1).strip(); trans_map[mid] = m.group(2).strip(); completed_set.add(mid); found_any = True
-                                        if found_any: job['trans_map'] = trans_map; job['done_ids'] = list(completed_set); st.session_state.job_progress[fname] = job; success = True; break
-                                    if not success: console_box.warning("⚠️ Formatting Error. Retrying..."); retry -= 1; time.sleep(1)
-                                except Exception as e:
-                                    if "429" in str(e).lower() and enable_cooldown:
-                                        if cooldown_hits < 1: 
-                                            console_box.empty(); err_box = console_box.container(); prog_bar = err_box.progress(1.0)
-                                            for t in range(60, 0, -1): err_box.error(f"🛑 Rate Limit Hit (429). Cooling down... {t}s"); prog_bar.progress(t / 60.0); time.sleep(1)
-                                            err_box.empty(); cooldown_hits += 1; continue
-                                        else: st.error("❌ CHECK API: Quota Exceeded (429)."); st.stop()
-                                    else: console_box.error(f"Error: {e}"); retry -= 1; time.sleep(2)
-                            if success: progress_text_ph.text(f"✅ Completed: {len(completed_set)} / {total_lines}"); progress_bar.progress(len(completed_set) / total_lines)
-                            else: st.error("❌ Batch Failed. Progress Saved. Click Resume."); st.stop()
-
-                        # Revision
-                        if enable_revision and trans_map:
-                            console_box.info("✨ Revising...")
-                            sorted_ids = sorted(trans_map.keys(), key=lambda x: int(x) if x.isdigit() else x)
-                            full_draft = "\n\n".join([f"[{vid}]\n{trans_map[vid]}" for vid in sorted_ids])
-                            glossary_note = ""
-                            if glossary_text: glossary_note = "\n[CRITICAL: DO NOT CHANGE THESE TERMS]:\n" + "\n".join([f"- {item['tgt']}" for item in st.session_state.glossary])
-                            rev_prompt = f"ROLE: Editor.\nTASK: Polish grammar/flow.\nCONTEXT: {file_context_summary}\n{glossary_note}\nNOTE: {revision_instr}\nINPUT FORMAT: [ID] Text\nOUTPUT FORMAT: [ID] Fixed Text\n\n{full_draft}"
+                    file_context_summary = "No analysis requested."
+                    if enable_analysis:
+                        if job['analysis']: file_context_summary = job['analysis']; console_box.info("🧠 Using Saved Analysis.")
+                        else:
                             try:
-                                rev_stream = client.models.generate_content_stream(model=model_name, contents=rev_prompt, config=types.GenerateContentConfig(temperature=0.3, max_output_tokens=max_tok_val))
-                                full_rev = ""
-                                for c in rev_stream: 
-                                    if c.text: full_rev += c.text; console_box.markdown(f"**Revising...**\n\n```text\n{full_rev}\n```")
-                                rev_matches = list(re.finditer(r'\[(\d+)\]\s*(?:^|\n|\s+)(.*?)(?=\n\[\d+\]|$)', full_rev, re.DOTALL))
-                                if rev_matches:
-                                    for m in rev_matches: 
-                                        if m.group(1) in trans_map: trans_map[m.group(1)] = m.group(2).strip()
-                                    console_box.success("✅ Revision Applied!")
-                            except Exception as e: console_box.warning(f"Revision skipped: {e}")
-
-                        # Mark Complete
-                        if trans_map: job['status'] = 'completed'; st.session_state.job_progress[fname] = job
+                                console_box.info("🧠 Analyzing content...")
+                                full_analysis_text = analyze(new_client, run_settings, file_lines, glossary.block([x.txt for x in file_lines]), cache=AnalysisCache(), telemetry=tel, name=fname, on_delta=lambda d: live.write(('ana', fname), "Analyzing...", d, fence=False))
+                                live.flush(); live.done(('ana', fname))
+                                file_context_summary = full_analysis_text; job['analysis'] = full_analysis_text; st.session_state.job_progress[fname] = job; journal.analysis(full_analysis_text)
+                                console_box.success("✅ Analysis Complete!"); time.sleep(1)
+                            except Exception as e: console_box.error(f"⚠️ Analysis Failed: {e}"); file_context_summary = "Failed."
+                    run_files.append({'name': fname, 'lines': file_lines, 'job': job, 'context': file_context_summary, 'journal': journal})
+
+                # Translation (all files, N batches in flight)
+                grand_total = sum(len(f['lines']) for f in run_files) or 1
+                def done_count(): return sum(len(f['job']['done_ids']) for f in run_files)
+                def on_stream(f, b, delta): live.write((f['name'], b['num']), f"Translating {f['name']} · Batch {b['num']}...", delta)
+                def on_batch(f, b, batch_tokens):
+                    live.done((f['name'], b['num']))
+                    n = done_count(); progress_text_ph.text(tel.progress_line(n, grand_total)); progress_bar.progress(min(n / grand_total, 1.0))
+                    last = next((r for r in reversed(tel.records) if r['stage'] == 'translate'), None)
+                    calls = [r for r in tel.records if r['stage'] == 'translate']; throttled = sum(r['status'] == '429' for r in calls)
+                    token_stats_ph.markdown(f"**Batch:** `{last['wall_s']:.1f}s` wall · `{last['ttfc_s'] or 0:.1f}s` to first chunk · `{last['output_tps'] or 0:.0f}` tok/s · `{last['prompt_tokens']}` → `{last['output_tokens']}` tokens"
+                                            f" | **Total:** `{engine.total_tokens}` tokens · `{len(calls)}` calls · `{throttled}` × 429 | **Batch Size:** `{engine.sizer.size()}` cues")
+                    file_status_ph.markdown(f"### 📂 Translating {len(run_files)} file(s) · last: **{f['name']}** batch {b['num']}")
+                def on_notice(kind, msg):
+                    if kind == 'warning': console_box.warning(msg)
+                    else: console_box.error(msg)
+
+                n = done_count(); progress_text_ph.text(tel.progress_line(n, grand_total)); progress_bar.progress(min(n / grand_total, 1.0))
+                engine = make_engine(run_settings, st.session_state.glossary, [st.session_state.active_key] + st.session_state.api_keys, key_limits=st.session_state.key_limits, telemetry=tel)
+                pool = engine.pool; tm = engine.tm
+                try: asyncio.run(engine.run(run_files, on_stream=on_stream, on_batch=on_batch, on_notice=on_notice))
+                except QuotaExceeded: st.error("❌ CHECK API: Quota Exceeded (429) on every key."); st.stop()
+                except BatchFailed: st.error("❌ Batch Failed. Progress Saved. Click Resume."); st.stop()
+                finally:
+                    st.session_state.key_limits.update(pool.limits())
+                    for f in run_files: f['journal'].close()
+                    if tm:
+                        tm_s = tm.stats(); tm.close()
+                        console_box.info(f"🗃️ Translation Memory: {engine.tm_hits} cues reused · run hit rate {tm_s['run_hit_rate']:.0%} · {tm_s['entries']:,} entries")
+                if engine.gap_cues or engine.extra_ids: st.caption(f"🧩 Reconciled {engine.gap_cues} dropped cue(s) in follow-up batches · ignored {engine.extra_ids} unexpected ID(s)")
+                if engine.scenes: st.caption(f"🎬 Scenes: {engine.scenes} packed whole into batches · {engine.scene_parts} batch(es) carried part of a scene too long for one")
+                if engine.hedged or engine.escalated: st.caption(f"🪁 Hedged {engine.hedged} slow batch(es), {engine.hedge_wins} answered first by the duplicate ({engine.hedge_saved:.1f}s saved) · ⤴️ {engine.escalated} batch(es) moved to {engine.fallback or '—'}")
+                if engine.glossary_requeues: st.caption(f"📖 Glossary check: re-sent {engine.glossary_requeues} cue(s) missing a required term · {engine.glossary_misses} still missing after retry")
+                if engine.prompt_cache and engine.prompt_cache.used: st.caption(f"🧊 Prompt cache: {engine.prompt_cache.created} cache(s) · {engine.prompt_cache.used} batch(es) sent without the prefix · {engine.cached_tokens:,} cached input tokens")
+                if engine.dedup_cues: console_box.info(f"🧬 Dedup: {engine.dedup_cues} duplicate cues filled locally · ~{engine.dedup_tokens_saved:,} tokens saved")
+                if len(pool.slots) > 1: st.dataframe(pool.summary(), use_container_width=True, hide_index=True)
+
+                for f in run_files:
+                    fname = f['name']; job = f['job']; trans_map = job['trans_map']; file_context_summary = f['context']; journal = f['journal']
+                    # Revision
+                    if enable_revision and trans_map:
+                        console_box.info(f"✨ Revising {fname}...")
+                        try:
+                            rs = revise(new_client, run_settings, trans_map, file_context_summary, st.session_state.glossary, telemetry=tel, name=fname, on_delta=lambda w, d: live.write(('rev', fname, w), f"Revising {fname} · window {w + 1}...", d))
+                            live.flush()
+                            for w in range(rs['windows']): live.done(('rev', fname, w))
+                            msg = f"Revision: {rs['changed']}/{rs['total']} lines changed ({rs['pct']:.1f}%) · {rs['windows']} window(s) in {rs['latency']:.1f}s · {rs['output_tokens']:,} output tokens"
+                            if rs['failed'] == rs['windows']: console_box.warning(f"⚠️ Revision failed: all {rs['windows']} window(s) failed, translations left as they were.")
+                            elif rs['failed']: console_box.warning(f"⚠️ {msg} · {rs['failed']} window(s) failed")
+                            else: console_box.success(f"✅ {msg}")
+                        except Exception as e: console_box.warning(f"Revision skipped: {e}")
+                        bump(job)
+
+                    # Mark Complete (the journal collapses to one snapshot of the finished job)
+                    if trans_map: job['status'] = 'completed'; st.session_state.job_progress[fname] = job; journal.compact(job)
                     
-                    st.balloons(); st.success("🎉 Process Complete!")
+                st.balloons(); st.success("🎉 Process Complete!")
             except Exception as e: st.error(f"❌ Fatal Error: {e}")
 
+# --- 📈 RUN REPORT ---
+if st.session_state.last_telemetry and st.session_state.last_telemetry.records:
+    tel = st.session_state.last_telemetry
+    with st.expander(f"📈 Last Run Report ({len(tel.records)} calls)", expanded=False):
+        st.dataframe(tel.summary(), use_container_width=True, hide_index=True)
+        c_r1, c_r2 = st.columns(2)
+        with c_r1: st.download_button("⬇️ Calls (CSV)", tel.to_csv(), "run_report.csv", "text/csv", use_container_width=True)
+        with c_r2: st.download_button("⬇️ Report (JSON)", tel.to_json(), "run_report.json", "application/json", use_container_width=True)
+
 # --- 📥 PERSISTENT DOWNLOAD SECTION ---
 if st.session_state.job_progress:
     st.divider()
     st.markdown("### 📥 Finished Files & Downloads")
+    exports = st.session_state.exports
     completed_files = []
     if uploaded_files:
         for f_obj in uploaded_files:
             fname = f_obj.name
             if fname in st.session_state.job_progress and st.session_state.job_progress[fname]['status'] == 'completed':
-                completed_files.append(f_obj)
                 job = st.session_state.job_progress[fname]
-                temp_proc = SubtitleProcessor(fname, f_obj.getvalue()); temp_proc.parse()
-                out_txt = temp_proc.get_output(job['trans_map'])
+                completed_files.append((fname, f_obj.getvalue(), job))
                 c_d1, c_d2 = st.columns([0.85, 0.15])
                 with c_d1: st.text(f"✅ {fname} (Ready)")
-                with c_d2: st.download_button("⬇️", out_txt, f"trans_{fname}", key=f"p_dl_{fname}")
+                with c_d2: st.download_button("⬇️", exports.output(fname, f_obj.getvalue(), job), f"trans_{fname}", key=f"p_dl_{fname}")
 
     if len(completed_files) > 1:
         st.markdown("#### 📦 Batch Download")
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zf:
-            for f_obj in completed_files:
-                fname = f_obj.name
-                temp_proc = SubtitleProcessor(fname, f_obj.getvalue()); temp_proc.parse()
-                final_map = st.session_state.job_progress[fname]['trans_map']
-                zf.writestr(f"trans_{fname}", temp_proc.get_output(final_map))
-        st.download_button("⬇️ Download All (ZIP)", zip_buffer.getvalue(), "translated_subtitles.zip", "application/zip", type="primary", use_container_width=True)
+        if exports.zip_ready(completed_files) or st.button("📦 Prepare ZIP", use_container_width=True):
+            with open(exports.build_zip(completed_files), "rb") as zip_file:
+                st.download_button("⬇️ Download All (ZIP)", zip_file, "translated_subtitles.zip", "application/zip", type="primary", use_container_width=True)
@@ -0,0 +1,362 @@
+import argparse
+import json
+import random
+import re
+import time
+
+from subtitles import SubtitleProcessor, load_subtitle, _parse_cache
+
+# --- ⏱️ BENCHMARKS ---
+# python bench.py [--suite parse,prompt,translate,structured,scenes,tail,cache] [--cues 5000] [--sizes 100,1000,5000,20000] [--json out.json]
+# parse:     parser/serializer per format against the previous implementation
+#            (kept below as LegacyProcessor), plus the memoized load.
+# prompt:    cost of carving batch prompts (memory, glossary selection, prompt text).
+# translate: end-to-end cues/second of the translation engine against the
+#            offline FakeClient (fakegemini.py), clean and with injected faults.
+# structured: legacy [ID] blocks vs JSON structured output on cues that carry
+#            bracketed tags and **markup**, with malformed replies injected.
+# scenes:    fixed slices vs scene-aware batching (memory on) on a file with
+#            real silences: wall time, batches that open mid-scene and
+#            [PREVIOUS CONTEXT] lines borrowed from another scene.
+# tail:      hedged requests off/on against injected stalls (p95/max batch
+#            wall time), and a flash -> strong cascade against a model that
+#            keeps failing to parse (runs that finish instead of halting).
+# cache:     prompt-prefix cache lifecycle on a fake clock that advances per
+#            batch: refresh across a run longer than the TTL, a clock jump past
+#            the TTL, and caches evicted server-side mid-run. Every run must
+#            finish and leave no cache behind.
+
+WORDS = "the of and to a in is you that it he was for on are as with his they I at be this have from".split()
+
+class LegacyProcessor:
+    def __init__(self, filename, content_bytes):
+        self.ext = '.' + filename.rsplit('.', 1)[-1].lower()
+        self.raw = content_bytes.decode('utf-8').replace('\r\n', '\n'); self.lines = []
+    def parse(self):
+        if self.ext == '.srt': self.srt()
+        elif self.ext == '.vtt': self.vtt()
+        elif self.ext == '.ass': self.ass()
+        return len(self.lines)
+    def srt(self):
+        for b in re.split(r'\n\s*\n', self.raw.strip()):
+            l = b.split('\n');
+            if len(l)>=3: self.lines.append({'id':l[0].strip(), 't':l[1].strip(), 'txt':"\n".join(l[2:])})
+    def vtt(self):
+        c={'id':None,'t':None,'txt':[]}; cnt=1; lines=self.raw.split('\n')
+        if lines and lines[0].strip()=="WEBVTT": lines=lines[1:]
+        for l in lines:
+            l=l.strip()
+            if "-->" in l: c['t']=l; c['id']=str(cnt); cnt+=1
+            elif l=="" and c['t']:
+                if c['txt']: self.lines.append(c.copy())
+                c={'id':None,'t':None,'txt':[]}
+            elif c['t']: c['txt'].append(l)
+        if c['t'] and c['txt']: self.lines.append(c)
+        for x in self.lines: x['txt']="\n".join(x['txt'])
+    def ass(self):
+        cnt=1
+        for l in self.raw.split('\n'):
+            if l.startswith("Dialogue:"):
+                p=l.split(',',9);
+                if len(p)==10: self.lines.append({'id':str(cnt),'raw':l,'txt':p[9].strip()}); cnt+=1
+    def get_output(self, data):
+        output = ""
+        if self.ext=='.srt':
+            for x in self.lines: output+=f"{x['id']}\n{x['t']}\n{data.get(x['id'],x['txt'])}\n\n"
+        elif self.ext=='.vtt':
+            output+="WEBVTT\n\n";
+            for x in self.lines: output+=f"{x['t']}\n{data.get(x['id'],x['txt'])}\n\n"
+        elif self.ext=='.ass':
+            cnt=1
+            for l in self.raw.split('\n'):
+                if l.startswith("Dialogue:"):
+                    p=l.split(',',9)
+                    if len(p)==10: output+=",".join(p[:9])+","+data.get(str(cnt),p[9].strip())+"\n"; cnt+=1
+                    else: output+=l+"\n"
+                else: output+=l+"\n"
+        return output
+
+def _ts(ms, sep=','):
+    h, ms = divmod(ms, 3600000); m, ms = divmod(ms, 60000); s, ms = divmod(ms, 1000)
+    return f"{h:02}:{m:02}:{s:02}{sep}{ms:03}"
+
+def make_subtitle(ext, n, seed=0):
+    """Synthetic .srt/.vtt/.ass file with `n` cues, as bytes."""
+    rnd = random.Random(seed); t = 0; out = []
+    if ext == '.vtt': out.append("WEBVTT\n")
+    if ext == '.ass': out.append("[Script Info]\nTitle: bench\n\n[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text")
+    for i in range(1, n + 1):
+        t += rnd.randint(200, 4000); d = rnd.randint(800, 4000)
+        txt = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 12)))
+        if rnd.random() < 0.3: txt += "\n" + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 8)))
+        if ext == '.srt': out.append(f"{i}\n{_ts(t)} --> {_ts(t + d)}\n{txt}\n")
+        elif ext == '.vtt': out.append(f"{_ts(t, '.')} --> {_ts(t + d, '.')}\n{txt}\n")
+        else: out.append(f"Dialogue: 0,{_ts(t, '.')[1:-1]},{_ts(t + d, '.')[1:-1]},Default,,0,0,0,,{txt.replace(chr(10), chr(92) + 'N')}")
+    return ("\n".join(out) + "\n").encode('utf-8')
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t0)
+    return best
+
+def bench_parse(cues=5000, repeat=5):
+    results = []
+    for ext in ('.srt', '.vtt', '.ass'):
+        data = make_subtitle(ext, cues); name = f"bench{ext}"
+        old = LegacyProcessor(name, data); old.parse(); new = SubtitleProcessor(name, data); new.parse()
+        trans = {x.id: x.txt.upper() for x in new.lines}
+        assert old.get_output(trans) == new.get_output(trans), f"{ext} output differs from legacy"
+        def legacy_parse(): LegacyProcessor(name, data).parse()
+        def fresh_parse(): SubtitleProcessor(name, data).parse()
+        def cached_load(): load_subtitle(name, data)
+        _parse_cache.clear(); load_subtitle(name, data)
+        row = {'format': ext, 'cues': cues,
+               'legacy_parse_ms': timed(legacy_parse, repeat) * 1000, 'parse_ms': timed(fresh_parse, repeat) * 1000,
+               'cached_load_ms': timed(cached_load, repeat) * 1000,
+               'legacy_output_ms': timed(lambda: old.get_output(trans), repeat) * 1000, 'output_ms': timed(lambda: new.get_output(trans), repeat) * 1000}
+        row['parse_speedup'] = row['legacy_parse_ms'] / row['parse_ms']; row['output_speedup'] = row['legacy_output_ms'] / row['output_ms']
+        results.append(row)
+    return results
+
+def make_glossary(n, seed=0):
+    rnd = random.Random(seed)
+    return [{'src': f"{rnd.choice(WORDS)} {rnd.choice(WORDS)}{i}" if i % 2 else f"Term{i}", 'tgt': f"T{i}"} for i in range(n)]
+
+def bench_prompt(cues=5000, batch=20, glossary_size=2000, repeat=3):
+    from engine import build_prompt, memory_block, cue_text
+    from glossary import GlossaryMatcher
+    lines = load_subtitle("bench.srt", make_subtitle('.srt', cues)).lines
+    settings = {'source_lang': "English", 'target_lang': "Hindi", 'user_instr': "Translate naturally."}
+    trans_map = {x.id: x.txt.upper() for x in lines}; glossary = make_glossary(glossary_size)
+    t0 = time.perf_counter(); matcher = GlossaryMatcher(glossary); compile_ms = (time.perf_counter() - t0) * 1000
+    chars = []
+    def carve(select):
+        chars.clear()
+        for a in range(0, len(lines), batch):
+            b = lines[a:a + batch]
+            gl = matcher.block([x.txt for x in b]) if select else full_block
+            p = build_prompt(settings, "A short context block.", gl, memory_block(lines, a, trans_map), "".join([cue_text(x) for x in b]))
+            chars.append(len(p))
+    from glossary import glossary_block
+    full_block = glossary_block(glossary)
+    full_ms = timed(lambda: carve(False), repeat) * 1000; full_chars = sum(chars) / len(chars)
+    sel_ms = timed(lambda: carve(True), repeat) * 1000; sel_chars = sum(chars) / len(chars)
+    return [{'cues': cues, 'batch': batch, 'glossary': glossary_size, 'batches': len(chars), 'matcher_compile_ms': compile_ms,
+             'full_glossary_ms': full_ms, 'full_glossary_avg_chars': full_chars, 'selected_glossary_ms': sel_ms, 'selected_glossary_avg_chars': sel_chars}]
+
+SCENARIOS = {'clean': {}, 'faulty': {'rate_limit': 0.03, 'truncate_over': 30, 'malformed': 0.03, 'drop': 0.02}}
+
+def bench_translate(sizes=(100, 1000, 5000, 20000), scenarios=('clean', 'faulty'), keys=4, concurrency=8, ttft=0.0, tps=0.0, batch=20):
+    import asyncio
+    from fakegemini import FakeClient
+    from pipeline import DEFAULT_SETTINGS, make_engine, new_job
+    results = []
+    for scenario in scenarios:
+        for n in sizes:
+            lines = load_subtitle("bench.srt", make_subtitle('.srt', n, seed=n)).lines
+            settings = dict(DEFAULT_SETTINGS, batch_sz=batch, concurrency=concurrency, key_rpm=1_000_000, key_tpm=1_000_000_000,
+                            enable_tm=False, enable_dedup=False, enable_prompt_cache=False, scene_gap=0)
+            clients = []
+            def factory(k, i=[0]):
+                i[0] += 1; c = FakeClient(api_key=k, ttft=ttft, tps=tps, prefix="T:", seed=i[0], **SCENARIOS[scenario]); clients.append(c)
+                return c
+            engine = make_engine(settings, [], [f"fake-key-{i:04d}" for i in range(keys)], client_factory=factory)
+            job = new_job(); t0 = time.perf_counter()
+            asyncio.run(engine.run([{'name': "bench.srt", 'lines': lines, 'job': job, 'context': "Benchmark."}]))
+            secs = time.perf_counter() - t0
+            assert len(job['trans_map']) == n, f"{scenario}/{n}: {len(job['trans_map'])} cues translated"
+            results.append({'scenario': scenario, 'cues': n, 'seconds': secs, 'cues_per_sec': n / secs, 'requests': sum(c.models.calls for c in clients),
+                            'tokens': engine.total_tokens, 'splits': engine.splits, 'gap_cues': engine.gap_cues,
+                            'rate_limited': sum(c.models.rate_limited for c in clients), 'truncated': sum(c.models.truncated for c in clients),
+                            'malformed': sum(c.models.malformed_sent for c in clients)})
+    return results
+
+def make_tricky(n, seed=0):
+    """.srt whose cues quote other cue headers ("[12] over radio") and use **emphasis**, the cases [ID] parsing trips on."""
+    rnd = random.Random(seed); out = []; t = 0
+    for i in range(1, n + 1):
+        t += rnd.randint(500, 3000); txt = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 10)))
+        r = rnd.random()
+        if r < 0.1: txt += f"\n[{rnd.randint(1, n)}] {rnd.choice(WORDS)} over radio"
+        elif r < 0.2: txt = f"**{txt}**"
+        out.append(f"{i}\n{_ts(t)} --> {_ts(t + 1500)}\n{txt}\n")
+    return ("\n".join(out) + "\n").encode('utf-8')
+
+def bench_structured(sizes=(1000, 5000), keys=4, concurrency=8, batch=20, malformed=0.05):
+    import asyncio
+    from fakegemini import FakeClient
+    from pipeline import DEFAULT_SETTINGS, make_engine, new_job
+    results = []
+    for mode in ('legacy', 'json'):
+        for n in sizes:
+            lines = load_subtitle("tricky.srt", make_tricky(n, seed=n)).lines
+            settings = dict(DEFAULT_SETTINGS, batch_sz=batch, concurrency=concurrency, key_rpm=1_000_000, key_tpm=1_000_000_000, enable_tm=False,
+                            enable_dedup=False, enable_prompt_cache=False, adaptive_batch=False, structured_output=mode == 'json', scene_gap=0)
+            clients = []
+            def factory(k, i=[0]):
+                i[0] += 1; c = FakeClient(api_key=k, prefix="T:", seed=i[0], malformed=malformed); clients.append(c)
+                return c
+            engine = make_engine(settings, [], [f"fake-key-{i:04d}" for i in range(keys)], client_factory=factory)
+            job = new_job(); t0 = time.perf_counter(); failed = False
+            try: asyncio.run(engine.run([{'name': "tricky.srt", 'lines': lines, 'job': job, 'context': "Benchmark."}]))
+            except Exception: failed = True
+            secs = time.perf_counter() - t0; requests = sum(c.models.calls for c in clients); first = -(-n // batch)
+            wrong = sum(1 for x in lines if job['trans_map'].get(x.id) != "T:" + x.txt.strip())
+            results.append({'mode': mode, 'cues': n, 'seconds': secs, 'requests': requests, 'retry_rate': (requests - first) / first,
+                            'splits': engine.splits, 'gap_cues': engine.gap_cues, 'malformed': sum(c.models.malformed_sent for c in clients),
+                            'wrong_cues': wrong, 'failed': failed})
+    return results
+
+def make_scenes(n, seed=0):
+    """.srt of scenes (3-60 cues, pauses under 1.5 s) separated by 3-20 s of silence."""
+    rnd = random.Random(seed); out = []; t = 0; i = 0
+    while i < n:
+        for _ in range(min(n - i, rnd.randint(3, 60))):
+            i += 1; d = rnd.randint(800, 3000); txt = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 10)))
+            out.append(f"{i}\n{_ts(t)} --> {_ts(t + d)}\n{txt}\n"); t += d + rnd.randint(50, 1500)
+        t += rnd.randint(3000, 20000)
+    return ("\n".join(out) + "\n").encode('utf-8')
+
+def bench_scenes(sizes=(1000, 5000), keys=4, concurrency=8, ttft=0.05, tps=0.0, batch=20):
+    import asyncio
+    from bisect import bisect_right
+    from engine import MEMORY_DEPTH
+    from fakegemini import FakeClient
+    from pipeline import DEFAULT_SETTINGS, make_engine, new_job
+    from subtitles import split_scenes, SCENE_GAP_MS
+    results = []
+    for gap in (0, SCENE_GAP_MS / 1000):
+        for n in sizes:
+            lines = load_subtitle("scenes.srt", make_scenes(n, seed=n)).lines; starts = split_scenes(lines)
+            scene = lambda p: bisect_right(starts, p) - 1
+            settings = dict(DEFAULT_SETTINGS, batch_sz=batch, concurrency=concurrency, key_rpm=1_000_000, key_tpm=1_000_000_000, enable_memory=True,
+                            enable_tm=False, enable_dedup=False, enable_prompt_cache=False, scene_gap=gap)
+            engine = make_engine(settings, [], [f"fake-key-{i:04d}" for i in range(keys)], client_factory=lambda k: FakeClient(api_key=k, ttft=ttft, tps=tps, prefix="T:"))
+            job = new_job(); batches = []; t0 = time.perf_counter()
+            asyncio.run(engine.run([{'name': "scenes.srt", 'lines': lines, 'job': job, 'context': "Benchmark."}], on_batch=lambda f, b, tok: batches.append(b['start'])))
+            secs = time.perf_counter() - t0
+            # Lines a fixed-slice batch would quote as context; scene mode stops at the scene start.
+            floor = (lambda p: starts[scene(p)]) if gap else (lambda p: 0)
+            borrowed = sum(1 for p in batches for q in range(max(floor(p), p - MEMORY_DEPTH), p) if scene(q) != scene(p))
+            results.append({'mode': 'scenes' if gap else 'slices', 'cues': n, 'scenes': len(starts), 'seconds': secs, 'cues_per_sec': n / secs,
+                            'batches': len(batches), 'mid_scene_starts': sum(1 for p in batches if p not in starts), 'borrowed_context_lines': borrowed})
+    return results
+
+TAIL_SCENARIOS = {
+    'stalls':    {'fake': {'stall': 0.05, 'stall_s': 3.0}, 'runs': [('plain', {}), ('hedged', {'enable_hedging': True})]},
+    'unparsable': {'fake': {'malformed': 0.5, 'drop': 0.1, 'strong': ("strong-model",)}, 'runs': [('plain', {}), ('cascade', {'fallback_model': "strong-model"})]},
+}
+
+def bench_tail(cues=2000, keys=4, concurrency=8, ttft=0.05, tps=0.0, batch=20):
+    import asyncio
+    from engine import BatchFailed
+    from fakegemini import FakeClient
+    from pipeline import DEFAULT_SETTINGS, make_engine, new_job
+    from telemetry import Telemetry
+    lines = load_subtitle("bench.srt", make_subtitle('.srt', cues, seed=7)).lines; results = []
+    for scenario, spec in TAIL_SCENARIOS.items():
+        for mode, extra in spec['runs']:
+            settings = dict(DEFAULT_SETTINGS, batch_sz=batch, concurrency=concurrency, key_rpm=1_000_000, key_tpm=1_000_000_000, enable_tm=False, enable_dedup=False,
+                            enable_prompt_cache=False, enable_memory=False, adaptive_batch=False, scene_gap=0, **extra)
+            def factory(k, i=[0]):
+                i[0] += 1; return FakeClient(api_key=k, ttft=ttft, tps=tps, prefix="T:", seed=i[0], **spec['fake'])
+            tel = Telemetry(); engine = make_engine(settings, [], [f"fake-key-{i:04d}" for i in range(keys)], client_factory=factory, telemetry=tel)
+            if engine.hedger: engine.hedger.floor = ttft * 2   # fake calls are far faster than the real-world floor
+            job = new_job(); t0 = time.perf_counter(); halted = False
+            try: asyncio.run(engine.run([{'name': "bench.srt", 'lines': lines, 'job': job, 'context': "Benchmark."}]))
+            except BatchFailed: halted = True
+            s = next((r for r in tel.summary() if r['stage'] == 'translate'), {})
+            results.append({'scenario': scenario, 'mode': mode, 'cues': cues, 'seconds': time.perf_counter() - t0, 'translated': len(job['trans_map']), 'halted': halted,
+                            'calls': s.get('calls', 0), 'wall_p95_s': s.get('wall_p95_s'), 'wall_max_s': s.get('wall_max_s'),
+                            'hedged': engine.hedged, 'hedge_wins': engine.hedge_wins, 'hedge_saved_s': s.get('hedge_saved_s', 0.0), 'escalated': engine.escalated})
+        base = results[-2]; r = results[-1]
+        r['p95_saved_s'] = round((base['wall_p95_s'] or 0) - (r['wall_p95_s'] or 0), 3)
+    return results
+
+def _jump_past_ttl(clients, clock, ttl): clock[0] += 2 * ttl
+def _evict_all(clients, clock, ttl):
+    for c in clients: c.caches.items.clear(); c.caches.expires.clear()
+
+CACHE_SCENARIOS = {'steady': None, 'expired': _jump_past_ttl, 'evicted': _evict_all}
+
+def bench_cache(cues=2000, keys=4, concurrency=8, ttft=0.01, batch=20, step=30.0):
+    import asyncio
+    from fakegemini import FakeClient
+    from pipeline import DEFAULT_SETTINGS, make_engine, new_job
+    lines = load_subtitle("bench.srt", make_subtitle('.srt', cues, seed=3)).lines; results = []
+    for scenario, fault in CACHE_SCENARIOS.items():
+        clock = [0.0]; clients = []; landed = [0]
+        def factory(k):
+            c = FakeClient(api_key=k, ttft=ttft, prefix="T:", clock=lambda: clock[0]); clients.append(c); return c
+        def on_batch(f, b, tok):
+            # Virtual time moves `step` seconds per landed batch; the fault hits once, halfway through.
+            clock[0] += step; landed[0] += 1
+            if fault and landed[0] == cues // batch // 2: fault(clients, clock, engine.prompt_cache.ttl)
+        settings = dict(DEFAULT_SETTINGS, batch_sz=batch, concurrency=concurrency, key_rpm=1_000_000, key_tpm=1_000_000_000, enable_tm=False, enable_dedup=False,
+                        enable_prompt_cache=True, enable_memory=False, adaptive_batch=False, scene_gap=0)
+        engine = make_engine(settings, [], [f"fake-key-{i:04d}" for i in range(keys)], client_factory=factory)
+        pc = engine.prompt_cache; pc.clock = lambda: clock[0]; pc.min_tokens = 0   # the bench prefix is tiny
+        job = new_job(); t0 = time.perf_counter()
+        asyncio.run(engine.run([{'name': "bench.srt", 'lines': lines, 'job': job, 'context': "Benchmark."}], on_batch=on_batch))
+        leaked = sum(1 for c in clients for name in list(c.caches.items) if c.caches.live(name))   # expired leftovers are gone server-side too
+        results.append({'scenario': scenario, 'cues': cues, 'seconds': time.perf_counter() - t0, 'virtual_s': clock[0], 'translated': len(job['trans_map']),
+                        'created': pc.created, 'refreshed': pc.refreshed, 'recreated': pc.recreates, 'cached_batches': pc.used, 'fallbacks': pc.fallbacks,
+                        'expired': sum(c.caches.expired for c in clients), 'cache_misses': sum(c.models.cache_misses for c in clients),
+                        'deleted': sum(c.caches.deleted for c in clients), 'leaked': leaked})
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline benchmarks: parsing, prompt building, translation throughput")
+    ap.add_argument("--suite", default="parse,prompt,translate", help="comma-separated: parse, prompt, translate, structured, scenes, tail, cache")
+    ap.add_argument("--cues", type=int, default=5000, help="cues for the parse and prompt suites"); ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--sizes", default="100,1000,5000,20000", help="file sizes (cues) for the translate suite")
+    ap.add_argument("--keys", type=int, default=4); ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--ttft", type=float, default=0.0, help="fake time to first token, seconds"); ap.add_argument("--tps", type=float, default=0.0, help="fake output tokens/second (0 = instant)")
+    ap.add_argument("--json", help="also write results to this file")
+    args = ap.parse_args()
+    suites = [x.strip() for x in args.suite.split(",") if x.strip()]
+    report = {'meta': {'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'args': vars(args)}}
+    if 'parse' in suites:
+        report['parse'] = bench_parse(args.cues, args.repeat)
+        for r in report['parse']:
+            print(f"{r['format']:5} {r['cues']:>6} cues | parse {r['legacy_parse_ms']:8.2f} -> {r['parse_ms']:8.2f} ms (x{r['parse_speedup']:.1f}) | cached {r['cached_load_ms']:.3f} ms"
+                  f" | output {r['legacy_output_ms']:8.2f} -> {r['output_ms']:8.2f} ms (x{r['output_speedup']:.1f})")
+    if 'prompt' in suites:
+        report['prompt'] = bench_prompt(args.cues, repeat=max(1, args.repeat // 2))
+        for r in report['prompt']:
+            print(f"prompt {r['cues']:>6} cues, {r['batches']} batches, {r['glossary']} glossary entries | compile {r['matcher_compile_ms']:.1f} ms"
+                  f" | full glossary {r['full_glossary_ms']:.1f} ms ({r['full_glossary_avg_chars']:.0f} chars/prompt)"
+                  f" | selected {r['selected_glossary_ms']:.1f} ms ({r['selected_glossary_avg_chars']:.0f} chars/prompt)")
+    if 'translate' in suites:
+        report['translate'] = bench_translate([int(x) for x in args.sizes.split(",")], keys=args.keys, concurrency=args.concurrency, ttft=args.ttft, tps=args.tps)
+        for r in report['translate']:
+            print(f"translate {r['scenario']:6} {r['cues']:>6} cues | {r['seconds']:7.2f} s | {r['cues_per_sec']:8.0f} cues/s | {r['requests']} requests"
+                  f" | 429 {r['rate_limited']} · truncated {r['truncated']} · malformed {r['malformed']} · splits {r['splits']} · gaps {r['gap_cues']}")
+    if 'structured' in suites:
+        report['structured'] = bench_structured([int(x) for x in args.sizes.split(",")], keys=args.keys, concurrency=args.concurrency)
+        for r in report['structured']:
+            print(f"structured {r['mode']:6} {r['cues']:>6} cues | {r['seconds']:6.2f} s | {r['requests']} requests (retry rate {r['retry_rate']:.1%})"
+                  f" | malformed {r['malformed']} · splits {r['splits']} · gaps {r['gap_cues']} · wrong cues {r['wrong_cues']}{' · FAILED' if r['failed'] else ''}")
+    if 'scenes' in suites:
+        report['scenes'] = bench_scenes([int(x) for x in args.sizes.split(",")], keys=args.keys, concurrency=args.concurrency, ttft=args.ttft or 0.05, tps=args.tps)
+        for r in report['scenes']:
+            print(f"scenes {r['mode']:6} {r['cues']:>6} cues, {r['scenes']} scenes | {r['seconds']:6.2f} s | {r['cues_per_sec']:7.0f} cues/s | {r['batches']} batches"
+                  f" | {r['mid_scene_starts']} open mid-scene · {r['borrowed_context_lines']} context lines from another scene")
+    if 'tail' in suites:
+        report['tail'] = bench_tail(min(args.cues, 2000), keys=args.keys, concurrency=args.concurrency, ttft=args.ttft or 0.05, tps=args.tps)
+        for r in report['tail']:
+            print(f"tail {r['scenario']:10} {r['mode']:7} {r['cues']:>6} cues | {r['seconds']:6.2f} s | {r['translated']} translated{' · HALTED' if r['halted'] else ''}"
+                  f" | {r['calls']} calls · p95 {r['wall_p95_s']}s · max {r['wall_max_s']}s | hedged {r['hedged']} (won {r['hedge_wins']}, {r['hedge_saved_s']}s saved) · escalated {r['escalated']}"
+                  + (f" | p95 saved {r['p95_saved_s']}s" if 'p95_saved_s' in r else ""))
+    if 'cache' in suites:
+        report['cache'] = bench_cache(min(args.cues, 2000), keys=args.keys, concurrency=args.concurrency, ttft=args.ttft or 0.01)
+        for r in report['cache']:
+            print(f"cache {r['scenario']:8} {r['cues']:>6} cues | {r['seconds']:6.2f} s ({r['virtual_s']:.0f} s virtual) | {r['translated']} translated"
+                  f" | created {r['created']} · refreshed {r['refreshed']} · recreated {r['recreated']} · cached batches {r['cached_batches']} · fallbacks {r['fallbacks']}"
+                  f" | expired {r['expired']} · 404s {r['cache_misses']} · deleted {r['deleted']} · leaked {r['leaked']}")
+    if args.json:
+        with open(args.json, "w") as f: json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from telemetry import Telemetry
+
+# --- 🖥️ HEADLESS CLI ---
+# python cli.py "season1/*.srt" subs/ --settings gemini_settings.json --glossary glossary.json --workers 4
+# Each file runs the full pipeline in a worker process; output is written next
+# to the source as trans_<name> (or over it with --overwrite, which leaves a
+# .<name>.translated marker so reruns skip files already translated in place).
+
+SUB_EXTS = ('.srt', '.vtt', '.ass')
+
+def collect(targets, recursive=False):
+    files = []
+    for t in targets:
+        if os.path.isdir(t):
+            pattern = os.path.join(t, "**", "*") if recursive else os.path.join(t, "*")
+            files += [p for p in glob.glob(pattern, recursive=recursive) if p.lower().endswith(SUB_EXTS)]
+        else: files += [p for p in glob.glob(t, recursive=recursive) if p.lower().endswith(SUB_EXTS)]
+    return sorted(p for p in dict.fromkeys(files) if not os.path.basename(p).startswith("trans_"))
+
+def _work(path, settings, glossary, overwrite, rate_share):
+    from pipeline import translate_path
+    return translate_path(path, settings, glossary, out_path=path if overwrite else None, rate_share=rate_share,
+                          log=lambda msg: print(msg, file=sys.stderr, flush=True))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Translate subtitle files with Gemini, without the Streamlit UI.")
+    ap.add_argument("targets", nargs="+", help="files, directories or glob patterns (.srt/.vtt/.ass)")
+    ap.add_argument("--settings", default="gemini_settings.json", help="settings saved by the app (default: %(default)s)")
+    ap.add_argument("--glossary", help="glossary JSON exported from the app")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: CPU count)")
+    ap.add_argument("--recursive", action="store_true", help="search directories recursively")
+    ap.add_argument("--overwrite", action="store_true", help="replace each source file instead of writing trans_<name>")
+    ap.add_argument("--report", metavar="PATH", help="write per-call telemetry for the whole run (.csv, otherwise JSON)")
+    ap.add_argument("--set", action="append", default=[], metavar="KEY=JSON", help="override a setting, e.g. --set batch_sz=40")
+    args = ap.parse_args(argv)
+
+    from pipeline import load_settings_file
+    settings = load_settings_file(args.settings)
+    for item in args.set:
+        k, _, v = item.partition("=")
+        try: settings[k] = json.loads(v)
+        except ValueError: settings[k] = v
+    glossary = []
+    if args.glossary:
+        with open(args.glossary, "r", encoding="utf-8") as f: glossary = json.load(f)
+    files = collect(args.targets, args.recursive)
+    if not files: ap.error("no .srt/.vtt/.ass files matched")
+    workers = max(1, min(args.workers, len(files)))
+    # Every process gets its own key pool, so each one takes an equal share of the per-key budgets.
+    rate_share = 1.0 / workers
+    print(f"{len(files)} file(s), {workers} worker(s)", file=sys.stderr)
+
+    failed = 0; tel = Telemetry()
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(_work, p, settings, glossary, args.overwrite, rate_share): p for p in files}
+        for fut in as_completed(futures):
+            try:
+                r = fut.result(); tel.records.extend(r.pop('calls', []))
+                if r.get('skipped'): print(f"⏩ {r['file']}: already translated in place"); continue
+                print(f"✅ {r['file']} -> {r['out']} ({r['translated']}/{r['cues']} cues, {r['tokens']} tokens, {r['seconds']}s)")
+            except Exception as e:
+                failed += 1; print(f"❌ {futures[fut]}: {e}", file=sys.stderr)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8", newline="") as f: f.write(tel.to_csv() if args.report.lower().endswith(".csv") else tel.to_json())
+        for s in tel.summary(): print(f"📈 {s['stage']}: {s['calls']} calls, {s['rate_limited']} × 429, {s['errors']} errors, {s['output_tokens']} output tokens, ttfc p50 {s['ttfc_p50_s']}s"
+                                           f", wall p95 {s['wall_p95_s']}s / max {s['wall_max_s']}s, {s['hedges']} hedged ({s['hedge_saved_s']}s saved), {s['cancelled']} cancelled"
+                                           + (f", by model {s['models']}" if len(s['models']) > 1 else ""), file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
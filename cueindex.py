@@ -0,0 +1,48 @@
+import re
+from collections import OrderedDict
+
+# --- 🗂️ EDITOR INDEX ---
+# What the File Editor pages over: cue IDs in file order, their current text,
+# a lowercased copy for substring search and the set of "Non-Roman" cues. An
+# edit updates one entry in each, so nothing is re-serialised or re-parsed.
+
+NON_WORD_RE = re.compile(r'[^\w\s]')
+NON_ASCII_RE = re.compile(r'[^\x00-\x7F]')
+SEARCH_CACHE_SIZE = 16
+
+def is_non_roman(txt): return NON_ASCII_RE.search(NON_WORD_RE.sub('', txt)) is not None
+
+class CueIndex:
+    def __init__(self, ids, texts):
+        """`ids`: cue IDs in display order; `texts`: {id: text} (missing IDs index as empty)."""
+        self.ids = list(ids); self.pos = {vid: i for i, vid in enumerate(self.ids)}
+        self.text = {vid: texts.get(vid, "") for vid in self.ids}
+        self.lower = {vid: t.lower() for vid, t in self.text.items()}
+        self.non_roman = {vid for vid, t in self.text.items() if is_non_roman(t)}
+        self._searches = OrderedDict()
+
+    def __len__(self): return len(self.ids)
+
+    def update(self, vid, txt):
+        if vid not in self.pos: return
+        self.text[vid] = txt; self.lower[vid] = txt.lower(); self._searches.clear()
+        if is_non_roman(txt): self.non_roman.add(vid)
+        else: self.non_roman.discard(vid)
+
+    def search(self, query):
+        q = query.lower(); hit = self._searches.get(q)
+        if hit is None:
+            hit = self._searches[q] = [vid for vid in self.ids if q in self.lower[vid]]
+            while len(self._searches) > SEARCH_CACHE_SIZE: self._searches.popitem(last=False)
+        else: self._searches.move_to_end(q)
+        return hit
+
+    def filter(self, query="", non_roman=False):
+        """IDs (in order) matching `query` and, if asked, the Non-Roman filter."""
+        ids = self.search(query) if query else self.ids
+        return [vid for vid in ids if vid in self.non_roman] if non_roman else ids
+
+    @staticmethod
+    def page_of(ids, vid, size):
+        try: return ids.index(vid) // size + 1
+        except ValueError: return None
@@ -0,0 +1,631 @@
+import asyncio
+import json
+import re
+import time
+from bisect import bisect_right
+from collections import deque
+from google.genai import types
+from keypool import QuotaExceeded, is_rate_limit, mask
+from promptcache import is_cache_error
+from exports import bump
+from subtitles import split_scenes
+
+# --- 🔁 ASYNC BATCH TRANSLATION ENGINE ---
+# Keeps N batches in flight across all files through the client's `aio` surface,
+# spreading them over every key in a KeyPool. Batches are carved on demand and
+# packed to an output-token budget; a truncated or malformed batch keeps the cues
+# that did come back and the rest is bisected and re-queued. Every response is
+# reconciled against the IDs sent: only cues that came back are marked done,
+# dropped ones are pooled per file and re-sent together. With memory enabled
+# a file has one batch in flight at a time, so its [PREVIOUS CONTEXT] block is
+# built from real translations. With `scene_gap` set, files are cut into scenes
+# at silences and batches take whole scenes: scenes run in parallel, and each
+# one's context comes only from earlier lines of the same scene. With hedging
+# on, a batch that outlives the run's learned latency percentile is raced by a
+# duplicate on another key (first complete response wins, the other is
+# cancelled); with a fallback model set, batches that keep failing move to it
+# instead of stopping the run.
+
+ID_RE = re.compile(r'\[(\d+)\]\s*(?:^|\n|\s+)(.*?)(?=\n\[\d+\]|$)', re.DOTALL)
+HEADER_RE = re.compile(r'\[(\d+)\]')
+NEXT_HEADER_RE = re.compile(r'\n\[(\d+)\]')
+HEADER_LOOKBACK = 12     # chars re-scanned so a header split across chunks is still found
+MEMORY_DEPTH = 3
+SHORT_CUE_WORDS = 2      # cues this short stay context-sensitive when `keep_short` is on
+OUTPUT_BUDGET = 0.5      # share of max_output_tokens a batch is packed up to
+TARGET_LATENCY = 30.0    # seconds; batches slower than this shrink the cue target
+MAX_BATCH_CUES = 500
+GAP_BATCH = 10           # dropped cues are pooled and re-sent in follow-up batches of this size
+HEDGE_PCT = 0.95         # a batch slower than this share of clean batches gets a hedged duplicate
+HEDGE_MIN_SAMPLES = 8    # clean batches seen before hedging starts
+HEDGE_MIN_DELAY = 2.0    # seconds; never hedge sooner than this
+HEDGE_WATCH_S = 60.0     # seconds a beaten primary is still watched for its first chunk (to measure what the hedge saved)
+
+class BatchFailed(Exception): pass
+
+def id_key(x): return int(x) if x.isdigit() else x
+
+class StreamParser:
+    """Incremental ID_RE: `feed()` returns each `[ID] text` block as soon as the next header closes it."""
+    def __init__(self):
+        self.buf = ""; self.tail = ""; self.cur = None; self.scan = 0   # cur = (id, text start) of the open block
+
+    def _clean(self, text, final=False):
+        # ``` and ** are stripped on the fly; a trailing run of ` or * waits for the next chunk.
+        s = self.tail + text
+        cut = len(s) if final else len(s.rstrip('`*'))
+        self.tail = s[cut:]
+        return s[:cut].replace("```", "").replace("**", "")
+
+    def _drain(self):
+        out = []
+        if self.cur is None:
+            m = HEADER_RE.search(self.buf, self.scan)
+            if not m: self.scan = max(0, len(self.buf) - HEADER_LOOKBACK); return out
+            self.cur = (m.group(1), m.end()); self.scan = m.end()
+        while True:
+            m = NEXT_HEADER_RE.search(self.buf, max(self.scan, self.cur[1]))
+            if not m: self.scan = max(self.cur[1], len(self.buf) - HEADER_LOOKBACK); return out
+            out.append((self.cur[0], self.buf[self.cur[1]:m.start()].strip()))
+            self.buf = self.buf[m.start():]; self.cur = (m.group(1), m.end() - m.start()); self.scan = self.cur[1]
+
+    def feed(self, text):
+        self.buf += self._clean(text)
+        return self._drain()
+
+    def close(self):
+        """Ends a stream that finished normally; the last open block counts as complete."""
+        self.buf += self._clean("", final=True)
+        out = self._drain()
+        if self.cur is not None: out.append((self.cur[0], self.buf[self.cur[1]:].strip())); self.cur = None
+        return out
+
+class JsonCueParser:
+    """Incremental reader for structured output, a JSON array of {"id", "t"} objects: `feed()` returns each pair as soon
+    as its object closes. Text around the array (prose, code fences) is skipped. A response that yields no pair at all is
+    re-read with the legacy StreamParser on `close()`, so a model that ignores the schema still lands."""
+    def __init__(self):
+        self.raw = []; self.obj = None; self.depth = 0; self.in_str = False; self.esc = False; self.found = 0
+
+    def feed(self, text):
+        self.raw.append(text); out = []
+        for ch in text:
+            if self.obj is not None: self.obj.append(ch)
+            if self.in_str:
+                if self.esc: self.esc = False
+                elif ch == '\\': self.esc = True
+                elif ch == '"': self.in_str = False
+            elif self.depth == 0:
+                if ch == '[': self.depth = 1
+            elif ch == '"': self.in_str = True
+            elif ch in '{[':
+                self.depth += 1   # arrays nested in an object (e.g. "alt": [...]) count too, or their `]` ends the outer one
+                if ch == '{' and self.depth == 2: self.obj = ['{']
+            elif ch in '}]':
+                self.depth -= 1
+                if ch == '}' and self.depth == 1 and self.obj is not None:
+                    pair = self._pair("".join(self.obj)); self.obj = None
+                    if pair: out.append(pair); self.found += 1
+        return out
+
+    @staticmethod
+    def _pair(s):
+        try: d = json.loads(s)
+        except ValueError: return None
+        if not isinstance(d, dict): return None
+        vid = str(d.get('id', "")).strip().strip('[]').strip(); txt = d.get('t', d.get('text'))
+        return (vid, str(txt).strip()) if vid and txt is not None else None
+
+    def close(self):
+        if self.found: return []
+        p = StreamParser(); text = "".join(self.raw)
+        return p.feed(text) + p.close()
+
+def cue_schema():
+    """response_schema for structured output: [{"id": str, "t": str}, ...]."""
+    return types.Schema(type=types.Type.ARRAY, items=types.Schema(type=types.Type.OBJECT, required=['id', 't'],
+                        properties={'id': types.Schema(type=types.Type.STRING), 't': types.Schema(type=types.Type.STRING)}))
+
+def structured_config(**kw):
+    return types.GenerateContentConfig(response_mime_type="application/json", response_schema=cue_schema(), **kw)
+
+def parse_response(text):
+    p = StreamParser()
+    return dict(p.feed(text) + p.close())
+
+def is_truncated(chunk):
+    return any('MAX_TOKENS' in str(getattr(c, 'finish_reason', None) or '') for c in (getattr(chunk, 'candidates', None) or []))
+
+def cue_text(x): return f"[{x.id}]\n{x.txt}\n\n"
+
+class TokenEstimator:
+    """Chars -> tokens ratios for prompts and for a batch's expected output, calibrated from usage_metadata."""
+    def __init__(self, in_ratio=0.25, out_ratio=0.35, alpha=0.3):
+        self.in_ratio = in_ratio; self.out_ratio = out_ratio; self.alpha = alpha
+    def estimate(self, text): return int(len(text) * self.in_ratio) + 1
+    def estimate_output(self, batch_txt): return int(len(batch_txt) * self.out_ratio) + 1
+    def observe(self, prompt, batch_txt, usage):
+        if not usage: return
+        p = getattr(usage, 'prompt_token_count', None); c = getattr(usage, 'candidates_token_count', None)
+        if p and prompt: self.in_ratio += self.alpha * (p / len(prompt) - self.in_ratio)
+        if c and batch_txt: self.out_ratio += self.alpha * (c / len(batch_txt) - self.out_ratio)
+
+class BatchSizer:
+    """Cue target per batch: grows while batches come back full, fast and clean, halves on failure."""
+    def __init__(self, start, adaptive=True, ceiling=MAX_BATCH_CUES, target_latency=TARGET_LATENCY):
+        self.target = float(start); self.adaptive = adaptive; self.ceiling = max(start, ceiling); self.target_latency = target_latency
+        self.batches = 0; self.failures = 0; self.cues = 0; self.busy_time = 0.0
+    def size(self): return max(1, int(self.target))
+    def failure_rate(self): return self.failures / max(1, self.batches + self.failures)
+    def cues_per_sec(self): return self.cues / self.busy_time if self.busy_time else 0.0
+    def success(self, n_cues, latency, full=None):
+        """`full`: the batch was as big as packing allowed (default: it reached the target)."""
+        self.batches += 1; self.cues += n_cues; self.busy_time += latency
+        if not self.adaptive: return
+        if latency > self.target_latency * 1.5: self.target = max(1.0, self.target * 0.8)
+        elif latency < self.target_latency and (n_cues >= self.size() if full is None else full) and self.failure_rate() < 0.1: self.target = min(self.ceiling, self.target * 1.15 + 1)
+    def failure(self, n_cues):
+        self.failures += 1
+        if self.adaptive: self.target = max(1.0, min(self.target, n_cues) / 2)
+
+class LatencyTracker:
+    """Seconds per cue of this run's clean batches. `threshold(n)`: how long a batch of n cues may run before it is
+    hedged, or None until enough batches have been seen."""
+    def __init__(self, pct=HEDGE_PCT, min_samples=HEDGE_MIN_SAMPLES, floor=HEDGE_MIN_DELAY, size=200):
+        self.pct = pct; self.min_samples = min_samples; self.floor = floor; self.samples = deque(maxlen=size)
+    def observe(self, n_cues, latency): self.samples.append(latency / max(1, n_cues))
+    def threshold(self, n_cues):
+        if len(self.samples) < self.min_samples: return None
+        s = sorted(self.samples)
+        return max(self.floor, s[min(len(s) - 1, int(len(s) * self.pct))] * max(1, n_cues))
+
+def pack_batch(queue, max_cues, budget, estimator):
+    # Pops cues off `queue` until the cue target or the estimated output budget is reached.
+    items = []; used = 0
+    while queue and len(items) < max_cues:
+        cost = estimator.estimate_output(cue_text(queue[0][1]))
+        if items and used + cost > budget: break
+        items.append(queue.popleft()); used += cost
+    return items
+
+def soft_cut(items):
+    """Where to end a batch that holds only part of a scene: after the widest pause in its back half."""
+    best = len(items); widest = None
+    for i in range(len(items) // 2, len(items) - 1):
+        a, b = items[i][1].end, items[i + 1][1].start
+        if a is not None and b is not None and (widest is None or b - a > widest): widest = b - a; best = i + 1
+    return best
+
+def normalize_cue(text): return " ".join(text.split())
+
+def dedupe_lines(lines, keep_short=False):
+    """Groups cues with the same normalized text. Returns {representative_id: [duplicate ids]}."""
+    first = {}; groups = {}
+    for x in lines:
+        norm = normalize_cue(x.txt)
+        if not norm or (keep_short and len(norm.split()) <= SHORT_CUE_WORDS): continue
+        if norm in first: groups.setdefault(first[norm], []).append(x.id)
+        else: first[norm] = x.id
+    return groups
+
+def memory_block(lines, start, trans_map, depth=MEMORY_DEPTH, floor=0):
+    prev = [x.id for x in lines[max(floor, start - depth) : start] if x.id in trans_map]
+    if not prev: return ""
+    return "\n[PREVIOUS CONTEXT]:\n" + "\n".join([f"[{k}] {trans_map[k]}" for k in prev]) + "\n"
+
+JSON_FORMAT = 'A JSON array with one object per input cue, in input order: {"id": "<ID>", "t": "<translated text>"}. Keep line breaks inside "t" as \\n.'
+
+def static_prefix(settings, context, glossary_text):
+    """The part of a batch prompt that is the same for every batch of a file (cacheable)."""
+    fmt = JSON_FORMAT if settings.get('structured_output') else "\n[ID]\nTranslated Text"
+    return f"""You are a professional translator.\nTASK: Translate {settings['source_lang']} to {settings['target_lang']}.\n[CONTEXT]: {context}\n{glossary_text}\n[INSTRUCTIONS]: {settings['user_instr']}\n[FORMAT]:{fmt}\n"""
+
+def batch_payload(memory, batch_txt): return f"{memory}\n[INPUT]:\n{batch_txt}"
+
+def build_prompt(settings, context, glossary_text, memory, batch_txt):
+    return static_prefix(settings, context, glossary_text) + batch_payload(memory, batch_txt)
+
+class TranslationEngine:
+    def __init__(self, pool, settings, glossary_text="", concurrency=4, retries=3, tm=None, tm_scope=None, dedup=False, dedup_keep_short=False, adaptive=True, glossary=None, prompt_cache=None, telemetry=None,
+                 fallback_pool=None):
+        # `glossary`: a GlossaryMatcher; each batch then gets only the entries its cues use, and outputs are checked against them.
+        self.pool = pool; self.settings = settings; self.glossary_text = glossary_text; self.glossary = glossary if glossary else None
+        self.concurrency = max(1, int(concurrency)); self.retries = retries
+        self.tm = tm; self.tm_scope = tm_scope; self.dedup = dedup; self.dedup_keep_short = dedup_keep_short
+        self.estimator = TokenEstimator(); self.sizer = BatchSizer(settings['batch_sz'], adaptive=adaptive)
+        self.total_tokens = 0; self.tm_hits = 0; self.dedup_cues = 0; self.dedup_tokens_saved = 0; self.splits = 0
+        self.gap_cues = 0; self.extra_ids = 0; self.glossary_requeues = 0; self.glossary_misses = 0
+        self.prompt_cache = prompt_cache; self.cached_tokens = 0; self.telemetry = telemetry
+        self.structured = bool(settings.get('structured_output')); self.schema_ok = self.structured
+        self.scene_gap = settings.get('scene_gap') or 0; self.scenes = 0; self.scene_parts = 0
+        self.hedger = LatencyTracker(settings.get('hedge_pct') or HEDGE_PCT) if settings.get('enable_hedging') else None
+        self.fallback = settings.get('fallback_model') or None
+        if self.fallback == settings['model_name']: self.fallback = None
+        # Quotas are per model, so the fallback model gets its own budgets on the same keys.
+        self.pools = {settings['model_name']: pool}
+        if self.fallback: self.pools[self.fallback] = fallback_pool or pool
+        self.hedged = 0; self.hedge_wins = 0; self.hedge_saved = 0.0; self.escalated = 0; self.primary_out = False
+
+    def _config(self, cached_content=None):
+        kw = dict(temperature=self.settings['temp_val'], max_output_tokens=self.settings['max_tok_val'], cached_content=cached_content)
+        return structured_config(**kw) if self.schema_ok else types.GenerateContentConfig(**kw)
+
+    def _budget(self):
+        # Half the output cap, but at least 256 tokens, and never more than the cap itself when that is set lower.
+        cap = self.settings['max_tok_val']
+        return min(cap, max(256, int(cap * OUTPUT_BUDGET)))
+
+    async def run(self, files, on_stream=None, on_batch=None, on_notice=None):
+        """`files`: dicts with 'name', 'lines', 'job', 'context' and optionally 'journal' (a JobJournal). Results land in each job in place."""
+        self._files = files; self._cb = (on_stream, on_batch, on_notice)
+        self._cond = asyncio.Condition(); self._inflight = 0; self._watchers = set()
+        for f in files:
+            f['done'] = f['job']['done_ids'] = set(f['job']['done_ids'])   # shared with the job, updated in place
+            if self.tm: self._apply_tm(f)
+            skip = self._apply_dedup(f) if self.dedup else set()
+            f['starts'] = split_scenes(f['lines'], int(self.scene_gap * 1000)) if self.scene_gap else [0]
+            f['scenes'] = self._scenes(f, [(i, x) for i, x in enumerate(f['lines']) if x.id not in f['done'] and x.id not in skip])
+            f['retry_q'] = deque(); f['busy'] = False; f['batch_no'] = 0; f['gaps'] = []; f['misses'] = {}; f['gloss_tried'] = set()
+            if self.prompt_cache:
+                # The cached prefix carries every glossary entry the file uses, so cached batches need none of their own.
+                gl = self.glossary.block([x.txt for x in f['lines']]) if self.glossary else self.glossary_text
+                f['system'] = static_prefix(self.settings, f['context'], gl); f['system_tokens'] = self.estimator.estimate(f['system'])
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        try: await asyncio.gather(*workers)
+        except BaseException:
+            for t in workers: t.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        finally:
+            for t in self._watchers: t.cancel()
+            await asyncio.gather(*self._watchers, return_exceptions=True)
+            if self.prompt_cache: await self.prompt_cache.close()
+            # The pools' clients were opened in this loop and die with it (the fallback pool shares them).
+            for client in {id(s.client): s.client for p in self.pools.values() for s in p.slots}.values():
+                try: await client.aio.aclose()
+                except Exception: pass
+
+    def _scenes(self, f, pending):
+        # Pending cues grouped by scene; without scene_gap the whole file is one scene.
+        scenes = deque(); starts = f['starts']
+        for p, x in pending:
+            floor = starts[bisect_right(starts, p) - 1]
+            if not scenes or scenes[-1]['floor'] != floor: scenes.append({'floor': floor, 'items': deque(), 'busy': False})
+            scenes[-1]['items'].append((p, x))
+        if self.scene_gap: self.scenes += len(scenes)
+        return scenes
+
+    def _apply_tm(self, f):
+        # Fills cues the translation memory already knows so only misses get batched.
+        pending = [x for x in f['lines'] if x.id not in f['done']]
+        if not pending: return
+        cached = self.tm.lookup(self.tm_scope, [x.txt for x in pending])
+        for x in pending:
+            if x.txt in cached: f['job']['trans_map'][x.id] = cached[x.txt]; f['done'].add(x.id); self.tm_hits += 1
+        self._journal(f, [x.id for x in pending if x.txt in cached]); bump(f['job'])
+
+    def _apply_dedup(self, f):
+        # Only one representative per duplicate group is sent; the rest are filled from it.
+        trans_map = f['job']['trans_map']
+        known = {normalize_cue(x.txt): trans_map[x.id] for x in f['lines'] if x.id in f['done'] and x.id in trans_map}
+        pending = []; filled = []
+        for x in f['lines']:
+            if x.id in f['done']: continue
+            norm = normalize_cue(x.txt)
+            if norm in known and not (self.dedup_keep_short and len(norm.split()) <= SHORT_CUE_WORDS):
+                trans_map[x.id] = known[norm]; f['done'].add(x.id); filled.append(x.id); self.dedup_cues += 1
+            else: pending.append(x)
+        self._journal(f, filled); bump(f['job'])
+        f['dups'] = dedupe_lines(pending, self.dedup_keep_short)
+        skip = {d for ds in f['dups'].values() for d in ds}
+        by_id = {x.id: x for x in pending}
+        self.dedup_cues += len(skip)
+        self.dedup_tokens_saved += sum(2 * self.estimator.estimate(cue_text(by_id[d])) for d in skip)
+        return skip
+
+    def _fan_out(self, f, mid):
+        for d in f.get('dups', {}).get(mid, ()):
+            f['job']['trans_map'][d] = f['job']['trans_map'][mid]; f['done'].add(d)
+
+    def _record(self, f, b, t0, t_first, usage, accepted, status, attempt, model=None, hedge=False, batch_s=None, saved_s=None):
+        if self.telemetry: self.telemetry.record('translate', f['name'], b['num'], t0, t_first, usage, len(b['lines']), accepted, status, attempt,
+                                                 model or b['model'] or self.settings['model_name'], hedge=hedge, batch_s=batch_s, saved_s=saved_s)
+
+    def _journal(self, f, ids):
+        # One append per landed batch: its cues plus the duplicates they fanned out to.
+        journal = f.get('journal')
+        if not journal or not ids: return
+        trans_map = f['job']['trans_map']; dups = f.get('dups', {}); rec = {}
+        for i in ids:
+            rec[i] = trans_map[i]
+            for d in dups.get(i, ()): rec[d] = trans_map[d]
+        journal.cues(rec); journal.maybe_compact(f['job'])
+
+    def _glossary_check(self, f, b, got):
+        # A cue whose output misses a required target term is re-sent once on its own; its first translation stays until then.
+        trans_map = f['job']['trans_map']
+        bad = {x.id for x in b['lines'] if x.id in got and self.glossary.violations(x.txt, trans_map[x.id])}
+        for p, x in b['items']:
+            if x.id in bad and x.id not in f['gloss_tried']:
+                f['gloss_tried'].add(x.id); f['done'].discard(x.id); self.glossary_requeues += 1
+                f['retry_q'].append(self._new_batch(f, [(p, x)], f"{b['num']}g"))
+            elif x.id in bad: self.glossary_misses += 1
+        return bad
+
+    def _new_batch(self, f, items, num=None, attempt=0, model=None):
+        if num is None: f['batch_no'] += 1; num = f['batch_no']
+        return {'items': items, 'start': items[0][0], 'lines': [x for _, x in items], 'num': num, 'attempt': attempt, 'hold': None, 'full': None, 'model': model}
+
+    def _next_batch(self):
+        # Earlier files first; with memory on, a file only ever has one batch in flight.
+        for f in self._files:
+            if f['busy']: continue
+            if f['retry_q']: b = f['retry_q'].popleft()
+            elif f['gaps'] and (len(f['gaps']) >= GAP_BATCH or not f['scenes']): b = self._gap_batch(f)
+            else: b = self._scene_batch(f)
+            if not b: continue
+            if self.settings['enable_memory'] and not self.scene_gap: f['busy'] = True
+            return f, b
+        return None
+
+    def _scene_batch(self, f):
+        # Whole scenes in file order up to the cue target / output budget. A scene bigger than one batch goes out in parts
+        # cut at a pause; with memory on, the next part waits for the previous one so it can quote its translations.
+        max_cues = self.sizer.size(); budget = self._budget(); items = []; used = 0; hold = None; full = False
+        for s in f['scenes']:
+            if s['busy']: continue
+            n = len(s['items'])
+            cost = sum(self.estimator.estimate_output(cue_text(x)) for _, x in s['items']) if len(items) + n <= max_cues else None
+            if cost is None or used + cost > budget:
+                full = True
+                if items: break
+                items = pack_batch(s['items'], max_cues, budget, self.estimator)
+                cut = soft_cut(items) if s['items'] and self.scene_gap else len(items)
+                s['items'].extendleft(reversed(items[cut:])); del items[cut:]
+                if s['items']:
+                    self.scene_parts += bool(self.scene_gap)
+                    if self.settings['enable_memory']: hold = s; s['busy'] = True
+                break
+            items.extend(s['items']); s['items'].clear(); used += cost
+        while f['scenes'] and not f['scenes'][0]['items']: f['scenes'].popleft()
+        if not items: return None
+        b = self._new_batch(f, items); b['hold'] = hold
+        if self.scene_gap: b['full'] = full   # a batch ended by a scene that did not fit counts as full for the sizer
+        return b
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                while True:
+                    nb = self._next_batch()
+                    if nb: self._inflight += 1; break
+                    if self._inflight == 0: self._cond.notify_all(); return
+                    await self._cond.wait()
+            f, b = nb
+            try: await self._run_batch(f, b)
+            finally:
+                async with self._cond:
+                    self._inflight -= 1; f['busy'] = False
+                    if b['hold']: b['hold']['busy'] = False
+                    self._cond.notify_all()
+
+    def _gap_batch(self, f):
+        f['gaps'].sort(key=lambda item: item[0])
+        items = f['gaps'][:min(GAP_BATCH, self.sizer.size())]; del f['gaps'][:len(items)]
+        f['batch_no'] += 1
+        return self._new_batch(f, items, f"{f['batch_no']}r")
+
+    def _requeue(self, f, b, rest):
+        # Bisect what is left so an oversized prompt is never resent as-is.
+        if len(rest) > 1:
+            mid = len(rest) // 2; self.splits += 1
+            halves = [self._new_batch(f, rest[:mid], f"{b['num']}a", model=b['model']), self._new_batch(f, rest[mid:], f"{b['num']}b", model=b['model'])]
+        else: halves = [self._new_batch(f, rest, b['num'], b['attempt'] + 1 if len(b['items']) == 1 else 0, b['model'])]
+        if halves[0]['attempt'] >= self.retries:
+            if self._escalate(f, b, rest, "keeps failing to parse"): return
+            raise BatchFailed(f"{f['name']} batch {b['num']}")
+        f['retry_q'].extendleft(reversed(halves))
+
+    def _escalate(self, f, b, items, why):
+        # Cues the primary model keeps failing go to the fallback model once, instead of stopping the run.
+        if not self.fallback or b['model'] == self.fallback: return False
+        self.escalated += 1; f['retry_q'].appendleft(self._new_batch(f, items, f"{b['num']}x", model=self.fallback))
+        on_notice = self._cb[2]
+        if on_notice: on_notice('warning', f"⤴️ {f['name']} batch {b['num']} {why}: {len(items)} cue(s) moved to {self.fallback}.")
+        return True
+
+    def _commit(self, f, ids, mid, txt):
+        # A cue is written to trans_map the moment its block is complete in the stream.
+        if mid not in ids or not txt: return False
+        f['job']['trans_map'][mid] = txt; f['done'].add(mid); self._fan_out(f, mid); bump(f['job'])
+        return True
+
+    async def _stream(self, f, b, slot, model, contents, config, sink, st, live=True):
+        # One streamed call. Complete cues go to `sink(id, text)` as they arrive; `st` gathers t_first, usage, truncation.
+        parser = JsonCueParser() if self.structured else StreamParser(); on_stream = self._cb[0]
+        stream = await slot.client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+        async for chunk_resp in stream:
+            if st['t_first'] is None: st['t_first'] = time.monotonic()
+            if st.get('muted'): return   # a hedge already answered; only this call's time to first chunk was still wanted
+            if chunk_resp.text:
+                for mid, txt in parser.feed(chunk_resp.text): sink(mid, txt)
+                if live and on_stream: on_stream(f, b, chunk_resp.text)
+            if chunk_resp.usage_metadata: st['usage'] = chunk_resp.usage_metadata
+            if is_truncated(chunk_resp): st['truncated'] = True
+        # A truncated stream's last block may be cut mid-line, so it is left for the re-queue.
+        if not st['truncated']:
+            for mid, txt in parser.close(): sink(mid, txt)
+
+    async def _hedged(self, f, b, pool, primary_slot, primary, pst, t_primary, est, model, prompt, sink, attempt):
+        # Once `primary` outlives the learned latency percentile, the same prompt goes out on another key (never the
+        # primary's, so a single key is never doubled up). The first call to finish cleanly wins. A losing hedge is
+        # cancelled; a beaten primary is handed to _watch(), which settles its slot. Returns the hedge's state dict if it
+        # won, else None.
+        delay = self.hedger.threshold(len(b['lines'])) if model == self.settings['model_name'] and len(pool.slots) > 1 else None
+        primary = asyncio.ensure_future(primary)
+        if delay is None: await primary; return None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done: return primary.result()
+            acq = asyncio.ensure_future(pool.acquire(est, exclude={primary_slot}))
+            await asyncio.wait({primary, acq}, return_when=asyncio.FIRST_COMPLETED)
+            if primary.done() and not primary.exception():
+                if acq.done() and not acq.exception(): pool.release(acq.result()[0], est)
+                else: acq.cancel(); await asyncio.gather(acq, return_exceptions=True)
+                return None
+            slot, ticket = await acq
+        except QuotaExceeded:
+            await primary; return None   # every other key is exhausted: no hedge, just wait for the primary
+        except asyncio.CancelledError:
+            primary.cancel(); raise
+        self.hedged += 1; buf = {}; st = {'t_first': None, 'usage': None, 'truncated': False}; t0 = time.monotonic()
+        hedge = asyncio.ensure_future(self._stream(f, b, slot, model, prompt, self._config(), buf.__setitem__, st, live=False))
+        pending = {primary, hedge}; winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                ok = [t for t in done if not t.exception()]
+                if ok: winner = primary if primary in ok else hedge
+        except asyncio.CancelledError:
+            pool.release(slot, est); raise
+        finally:
+            losers = [t for t in pending if t is not primary or winner is not hedge]
+            for t in losers: t.cancel()
+            await asyncio.gather(*losers, return_exceptions=True)
+        usage = st['usage']; tokens = (usage.total_token_count or 0) if usage else 0
+        if winner is hedge:
+            self.hedge_wins += 1; pool.release(slot, est, tokens, ticket)
+            for mid, txt in buf.items(): sink(mid, txt)
+            self._record(f, b, t0, st['t_first'], usage, len(buf), 'truncated' if st['truncated'] else 'ok', attempt, model, hedge=True, batch_s=time.monotonic() - t_primary)
+            w = asyncio.ensure_future(self._watch(f, b, pool, primary_slot, primary, pst, t_primary, time.monotonic(), est, model, attempt))
+            self._watchers.add(w); w.add_done_callback(self._watchers.discard)
+            return st
+        e = hedge.exception() if hedge.done() and not hedge.cancelled() else None
+        if e is not None and is_rate_limit(e): pool.penalize(slot, e)
+        else: pool.release(slot, est)
+        self._record(f, b, t0, st['t_first'], usage, 0, 'error' if e else 'cancelled', attempt, model, hedge=True)
+        if winner is None: raise primary.exception()
+        return None
+
+    async def _watch(self, f, b, pool, slot, primary, pst, t_primary, t_win, est, model, attempt):
+        # The hedge answered at `t_win` while the primary was still out. Without the hedge the batch would have waited at
+        # least until the primary's first chunk, so that (or its failure, or the watch limit) minus `t_win` is a lower
+        # bound on the tail latency saved. Its output is muted meanwhile; it is cancelled as soon as it starts streaming.
+        pst['muted'] = True
+        try:
+            if pst['t_first'] is None: await asyncio.wait({primary}, timeout=HEDGE_WATCH_S)
+        except asyncio.CancelledError: pass   # the run is ending: keep what has been observed so far
+        end = pst['t_first'] or time.monotonic()
+        if not primary.done(): primary.cancel()
+        await asyncio.gather(primary, return_exceptions=True)
+        e = primary.exception() if not primary.cancelled() else None
+        saved = max(0.0, end - t_win); self.hedge_saved += saved
+        # A primary that hit a 429 (before or after the hedge won) backs its key off like any other 429, not a success.
+        if e is not None and is_rate_limit(e): pool.penalize(slot, e)
+        else: pool.release(slot, est)
+        self._record(f, b, t_primary, pst['t_first'], pst['usage'], 0, ('429' if is_rate_limit(e) else 'error') if e else 'cancelled', attempt, model, saved_s=round(saved, 3))
+
+    async def _run_batch(self, f, b):
+        on_stream, on_batch, on_notice = self._cb
+        trans_map = f['job']['trans_map']; ids = {x.id for x in b['lines']}
+        batch_txt = "".join([cue_text(x) for x in b['lines']])
+        floor = f['starts'][bisect_right(f['starts'], b['start']) - 1]
+        memory = memory_block(f['lines'], b['start'], trans_map, floor=floor) if self.settings['enable_memory'] else ""
+        glossary_text = self.glossary.block([x.txt for x in b['lines']]) if self.glossary else self.glossary_text
+        prompt = build_prompt(self.settings, f['context'], glossary_text, memory, batch_txt)
+        est = self.estimator.estimate(prompt) + self.estimator.estimate_output(batch_txt)
+        retry = self.retries; attempt = -1
+        while True:
+            if self.primary_out and not b['model']: b['model'] = self.fallback; self.escalated += 1
+            model = b['model'] or self.settings['model_name']; pool = self.pools.get(model, self.pool)
+            try: slot, ticket = await pool.acquire(est)
+            except QuotaExceeded:
+                # Every key is out of quota for the primary model: this and all later batches move to the fallback.
+                if not self.fallback or model == self.fallback: raise
+                if on_notice and not self.primary_out: on_notice('warning', f"⤴️ Quota exhausted on every key for {model}: remaining batches go to {self.fallback}.")
+                self.primary_out = True; continue
+            dropped = None; t0 = time.monotonic(); won = None
+            st = {'t_first': None, 'usage': None, 'truncated': False}; got = set(); extras = set(); cache_name = None; attempt += 1
+            def sink(mid, txt): (got if self._commit(f, ids, mid, txt) else extras).add(mid)
+            try:
+                # Cached prefixes belong to the primary model; escalated batches send full prompts.
+                if self.prompt_cache and not b['model']: cache_name = await self.prompt_cache.handle(slot, f['name'], f['system'], f['system_tokens'])
+                contents = batch_payload(memory, batch_txt) if cache_name else prompt
+                call = self._stream(f, b, slot, model, contents, self._config(cache_name), sink, st)
+                if self.hedger: won = await self._hedged(f, b, pool, slot, call, st, t0, est, model, prompt, sink, attempt)
+                else: await call
+            except asyncio.CancelledError:
+                pool.release(slot, est); self._journal(f, got)
+                raise
+            except Exception as e:
+                if is_rate_limit(e): backoff = pool.penalize(slot, e)
+                else:
+                    pool.release(slot, est)
+                    if cache_name and is_cache_error(e): await self.prompt_cache.invalidate(slot, f['name'])   # a 5xx keeps the handle
+                if self.schema_ok and not got and not is_rate_limit(e) and ('response_schema' in str(e) or 'response_mime_type' in str(e)):
+                    # The model/API refuses structured output: keep the JSON prompt, drop the schema, and resend.
+                    self.schema_ok = False
+                    if on_notice: on_notice('warning', f"Structured output not supported here ({e}); continuing without a response schema.")
+                    continue
+                if got: dropped = e   # keep the cues that made it, re-queue the rest below
+                elif cache_name and is_cache_error(e):
+                    # The handle is gone (and now invalidated): resend at once, not as a retry. The next handle() remakes the
+                    # cache once; if that one fails as well, the file goes back to full prompts on this key.
+                    self._record(f, b, t0, st['t_first'], st['usage'], 0, 'error', attempt)
+                    continue
+                elif is_rate_limit(e):
+                    # Only this key backs off; the batch goes straight back to the pool.
+                    self._record(f, b, t0, st['t_first'], st['usage'], 0, '429', attempt)
+                    if on_notice: on_notice('throttle', f"🛑 Key {mask(slot.key)} throttled (429). Backing off {backoff:.0f}s, other keys continue.")
+                    continue
+                else:
+                    self._record(f, b, t0, st['t_first'], st['usage'], 0, 'error', attempt)
+                    if on_notice: on_notice('error', f"Error: {e}")
+                    retry -= 1
+                    if retry <= 0:
+                        if not self.fallback or model == self.fallback: raise BatchFailed(f"{f['name']} batch {b['num']}")
+                        b['model'] = self.fallback; retry = self.retries; self.escalated += 1
+                        if on_notice: on_notice('warning', f"⤴️ {f['name']} batch {b['num']} keeps failing: moved to {self.fallback}.")
+                        continue
+                    await asyncio.sleep(2); continue
+            break
+        if won: st = won   # the beaten primary's slot and record belong to _watch()
+        usage = st['usage']; truncated = st['truncated']; t_first = st['t_first']
+        latency = time.monotonic() - t0
+        batch_tokens = (usage.total_token_count or 0) if usage else 0
+        if not dropped and not won: pool.release(slot, est, batch_tokens, ticket)
+        self.total_tokens += batch_tokens; self.cached_tokens += (getattr(usage, 'cached_content_token_count', 0) or 0) if usage else 0
+        self.estimator.observe(prompt, batch_txt, usage)
+
+        accepted = len(got); self.extra_ids += len(extras)
+        if not won: self._record(f, b, t0, t_first, usage, accepted, 'truncated' if truncated else 'dropped' if dropped else 'ok' if accepted else 'malformed', attempt, batch_s=latency)
+        self._journal(f, got)
+        rest = [(p, x) for p, x in b['items'] if x.id not in f['done']]
+        bad = self._glossary_check(f, b, got) if self.glossary and accepted else ()
+        if accepted and self.tm: self.tm.store(self.tm_scope, [(x.txt, trans_map[x.id]) for x in b['lines'] if x.id in got and x.id not in bad])
+        if accepted and not truncated and not dropped:
+            if self.hedger and not won and model == self.settings['model_name']: self.hedger.observe(len(b['lines']), latency)
+            if len(rest) * 4 <= len(b['items']): self.sizer.success(len(b['lines']), latency, b['full'])
+            else: self.sizer.failure(len(b['lines']))
+            if on_batch: on_batch(f, b, batch_tokens)
+            if rest or extras:
+                if on_notice: on_notice('warning', f"🧩 {f['name']} batch {b['num']}: {len(rest)} cue(s) missing, {len(extras)} unexpected ID(s). Pooled for a follow-up batch.")
+                self._add_gaps(f, b, rest)
+            return
+        self.sizer.failure(len(b['lines']))
+        if accepted and on_batch: on_batch(f, b, batch_tokens)
+        if not rest: return
+        reason = f"cut off ({dropped})" if dropped else ('truncated' if truncated else 'malformed')
+        if on_notice: on_notice('warning', f"✂️ {f['name']} batch {b['num']} {reason}: kept {accepted}, re-queuing {len(rest)} cue(s).")
+        self._requeue(f, b, rest)
+
+    def _add_gaps(self, f, b, rest):
+        stuck = []
+        for p, x in rest:
+            f['misses'][x.id] = f['misses'].get(x.id, 0) + 1
+            if f['misses'][x.id] >= self.retries:
+                if not self.fallback or b['model'] == self.fallback: raise BatchFailed(f"{f['name']} cue {x.id} never came back")
+                stuck.append((p, x))
+        if stuck: self._escalate(f, b, stuck, "keeps dropping cues")
+        rest = [item for item in rest if item not in stuck]
+        f['gaps'].extend(rest); self.gap_cues += len(rest)
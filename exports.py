@@ -0,0 +1,57 @@
+import os
+import tempfile
+import weakref
+import zipfile
+
+from subtitles import content_hash, load_subtitle
+
+# --- 📥 DOWNLOAD CACHE ---
+# Translated outputs are cached per file against (content hash, job['rev']),
+# where `rev` is bumped whenever that job's trans_map changes. The batch ZIP is
+# only built when asked for, written member by member to a temp file, and
+# reused until any member's key changes.
+
+def bump(job):
+    """Marks `job['trans_map']` as changed so cached downloads get rebuilt."""
+    job['rev'] = job.get('rev', 0) + 1
+
+def _remove(path):
+    try: os.remove(path)
+    except OSError: pass
+
+class ExportCache:
+    def __init__(self):
+        self.outputs = {}; self.zip_key = None; self.zip_path = None; self._finalizer = None
+
+    def _key(self, fname, content_bytes, job): return (fname, content_hash(content_bytes), job.get('rev', 0))
+
+    def output(self, fname, content_bytes, job):
+        key = self._key(fname, content_bytes, job)
+        hit = self.outputs.get(fname)
+        if hit and hit[0] == key: return hit[1]
+        out = load_subtitle(fname, content_bytes).get_output(job['trans_map'])
+        self.outputs[fname] = (key, out)
+        return out
+
+    def zip_ready(self, members):
+        """True when the spooled ZIP still matches `members` ([(fname, content_bytes, job)])."""
+        return self.zip_path is not None and self.zip_key == tuple(self._key(*m) for m in members) and os.path.exists(self.zip_path)
+
+    def build_zip(self, members):
+        if self.zip_ready(members): return self.zip_path
+        fd, path = tempfile.mkstemp(prefix="subs_", suffix=".zip"); os.close(fd)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for fname, content_bytes, job in members:
+                with zf.open(f"trans_{fname}", "w") as dst: dst.write(self.output(fname, content_bytes, job).encode('utf-8'))
+        self.discard_zip()
+        self.zip_key = tuple(self._key(*m) for m in members); self.zip_path = path
+        self._finalizer = weakref.finalize(self, _remove, path)
+        return path
+
+    def discard_zip(self):
+        if self._finalizer: self._finalizer()
+        self.zip_key = None; self.zip_path = None; self._finalizer = None
+
+    def forget(self, keep):
+        # Drops cached outputs for files that are no longer uploaded.
+        for fname in [f for f in self.outputs if f not in keep]: del self.outputs[fname]
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import random
+import re
+import time
+
+# --- 🧪 FAKE GEMINI CLIENT ---
+# Drop-in stand-in for genai.Client (models / aio.models / caches surfaces used
+# by this app) that answers offline: every "[ID]\ntext" block after [INPUT]: is
+# echoed back with a prefix, streamed in chunks at a configurable time to first
+# token and tokens/second. Faults are injected deterministically from `seed`:
+# 429s, MAX_TOKENS truncation, dropped cues and malformed [ID] output. With
+# response_mime_type="application/json" the reply is a JSON array of {id, t}
+# and "malformed" wraps it in chatter and a code fence instead. `stall` holds a
+# share of requests for `stall_s` before the first chunk; models listed in
+# `strong` never get faults (a stand-in for the stronger fallback model).
+# Cached contents live for their TTL on `clock` (pass a fake one to drive
+# refresh and expiry); a request or update naming a gone cache gets a 404.
+#   client = FakeClient(ttft=0.4, tps=120, rate_limit=0.05, seed=1)
+#   make_engine(settings, glossary, keys, client_factory=lambda k: FakeClient(...))
+
+BLOCK_RE = re.compile(r'\[([^\]\n]+)\]\n(.*?)(?=\n\n\[[^\]\n]+\]\n|\n*$)', re.DOTALL)
+CHARS_PER_TOKEN = 4
+
+class RateLimited(Exception): pass
+class NotFound(Exception): pass
+
+class Usage:
+    def __init__(self, prompt, output, cached=0):
+        self.prompt_token_count = prompt; self.candidates_token_count = output; self.total_token_count = prompt + output
+        self.cached_content_token_count = cached
+
+class Candidate:
+    def __init__(self, finish_reason): self.finish_reason = finish_reason
+
+class Chunk:
+    def __init__(self, text, usage=None, finish_reason=None):
+        self.text = text; self.usage_metadata = usage; self.candidates = [Candidate(finish_reason)] if finish_reason else None
+
+class Response(Chunk): pass
+
+class CachedContent:
+    def __init__(self, name, system_instruction): self.name = name; self.system_instruction = system_instruction
+
+class FakeModels:
+    """`ttft` seconds before the first chunk, then `tps` output tokens/second (0 = instant). Rates are per request."""
+    def __init__(self, owner, ttft=0.0, tps=0.0, chunk_tokens=16, prefix="", rate_limit=0.0, truncate_over=None,
+                 malformed=0.0, drop=0.0, seed=0, canned="Genre: Drama. Tone: Neutral. Characters: none noted.", sleep=asyncio.sleep,
+                 stall=0.0, stall_s=30.0, strong=()):
+        self.owner = owner; self.ttft = ttft; self.tps = tps; self.chunk_tokens = chunk_tokens; self.prefix = prefix; self.canned = canned
+        self.rate_limit = rate_limit; self.truncate_over = truncate_over; self.malformed = malformed; self.drop = drop
+        self.rnd = random.Random(seed); self.sleep = sleep; self.stall = stall; self.stall_s = stall_s; self.strong = set(strong)
+        self.calls = 0; self.rate_limited = 0; self.truncated = 0; self.malformed_sent = 0; self.stalled = 0; self.cache_misses = 0; self.by_model = {}
+
+    def _fault(self, rate, faulty):
+        return faulty and rate and self.rnd.random() < rate
+
+    def _answer(self, model, contents, config):
+        self.calls += 1; self.by_model[model] = self.by_model.get(model, 0) + 1; faulty = model not in self.strong
+        first = self.ttft
+        if self._fault(self.stall, faulty): self.stalled += 1; first += self.stall_s
+        if self._fault(self.rate_limit, faulty):
+            self.rate_limited += 1; raise RateLimited("429 RESOURCE_EXHAUSTED: Quota exceeded. retryDelay: 1s")
+        cache = getattr(config, 'cached_content', None)
+        if cache and not self.owner.caches.live(cache): self.cache_misses += 1; raise NotFound(f"404 NOT_FOUND: CachedContent {cache} not found or expired")
+        body = contents.split("[INPUT]:\n")[-1]
+        blocks = [(i, t) for i, t in BLOCK_RE.findall(body) if not self._fault(self.drop, faulty)]
+        bad = self._fault(self.malformed, faulty); self.malformed_sent += bool(bad)
+        if getattr(config, 'response_mime_type', None) == "application/json":
+            out = json.dumps([{'id': i, 't': self.prefix + t} for i, t in blocks], ensure_ascii=False)
+            if bad: out = f"Sure! Here is the JSON:\n```json\n{out}\n```"
+        elif bad: out = "Sure! Here are the translations:\n" + "\n".join(f"{i}) {self.prefix}{t}" for i, t in blocks)
+        else: out = "".join(f"[{i}]\n{self.prefix}{t}\n\n" for i, t in blocks) if blocks else self.canned
+        finish = "STOP"
+        if faulty and self.truncate_over and len(blocks) > self.truncate_over:
+            self.truncated += 1; out = out[: len(out) * self.truncate_over // len(blocks)]; finish = "MAX_TOKENS"
+        cached = len(self.owner.caches.items.get(cache or "", "")) // CHARS_PER_TOKEN
+        usage = Usage(len(contents) // CHARS_PER_TOKEN + cached, len(out) // CHARS_PER_TOKEN, cached)
+        step = max(1, self.chunk_tokens * CHARS_PER_TOKEN)
+        return [out[k:k + step] for k in range(0, len(out), step)], usage, finish, first
+
+    def _delays(self, pieces, first):
+        per_chunk = (self.chunk_tokens / self.tps) if self.tps else 0.0
+        return [first] + [per_chunk] * (len(pieces) - 1)
+
+    def generate_content_stream(self, model, contents, config=None):
+        pieces, usage, finish, first = self._answer(model, contents, config)
+        for piece, delay in zip(pieces, self._delays(pieces, first)):
+            if delay: time.sleep(delay)
+            yield Chunk(piece)
+        yield Chunk("", usage, finish)
+
+    def generate_content(self, model, contents, config=None):
+        pieces, usage, finish, first = self._answer(model, contents, config)
+        if first or self.tps: time.sleep(sum(self._delays(pieces, first)))
+        return Response("".join(pieces), usage, finish)
+
+class FakeAsyncModels:
+    def __init__(self, sync): self.sync = sync
+
+    async def generate_content_stream(self, model, contents, config=None):
+        s = self.sync; pieces, usage, finish, first = s._answer(model, contents, config)
+        async def stream():
+            for piece, delay in zip(pieces, s._delays(pieces, first)):
+                if delay: await s.sleep(delay)
+                yield Chunk(piece)
+            yield Chunk("", usage, finish)
+        return stream()
+
+    async def generate_content(self, model, contents, config=None):
+        s = self.sync; pieces, usage, finish, first = s._answer(model, contents, config)
+        if first or s.tps: await s.sleep(sum(s._delays(pieces, first)))
+        return Response("".join(pieces), usage, finish)
+
+def _ttl(config): return float(str(getattr(config, 'ttl', None) or "3600s").rstrip("s"))
+
+class FakeCaches:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock; self.items = {}; self.expires = {}; self.created = 0; self.updated = 0; self.deleted = 0; self.expired = 0
+    def live(self, name):
+        if name in self.items and self.clock() >= self.expires[name]: self.expired += 1; del self.items[name], self.expires[name]
+        return name in self.items
+    def _get(self, name):
+        if not self.live(name): raise NotFound(f"404 NOT_FOUND: CachedContent {name} not found or expired")
+    def create(self, model, config):
+        self.created += 1; name = f"cachedContents/fake-{self.created}"
+        self.items[name] = getattr(config, 'system_instruction', "") or ""; self.expires[name] = self.clock() + _ttl(config)
+        return CachedContent(name, self.items[name])
+    def update(self, name, config): self._get(name); self.updated += 1; self.expires[name] = self.clock() + _ttl(config)
+    def delete(self, name): self._get(name); self.deleted += 1; del self.items[name], self.expires[name]
+
+class FakeAsyncCaches:
+    def __init__(self, sync): self.sync = sync
+    async def create(self, model, config): return self.sync.create(model, config)
+    async def update(self, name, config): return self.sync.update(name, config)
+    async def delete(self, name): return self.sync.delete(name)
+
+class _Aio:
+    def __init__(self, client): self.models = FakeAsyncModels(client.models); self.caches = FakeAsyncCaches(client.caches); self.closed = False
+    async def aclose(self): self.closed = True
+
+class FakeClient:
+    """Accepts (and ignores) genai.Client's arguments; `clock` times cache TTLs, everything else goes to FakeModels."""
+    def __init__(self, api_key=None, clock=time.monotonic, **kw):
+        self.api_key = api_key; self.caches = FakeCaches(clock); self.models = FakeModels(self, **kw); self.aio = _Aio(self)
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
@@ -0,0 +1,68 @@
+from collections import deque
+
+# --- 📖 GLOSSARY MATCHING ---
+# The glossary is compiled once into an Aho-Corasick automaton, so each prompt
+# carries only the entries whose terms occur in its cues (one pass over the text,
+# however many entries there are). The same matcher backs the post-check that
+# a cue's output actually uses the required target terms.
+
+def glossary_block(entries):
+    if not entries: return ""
+    g_list = [f"- {item['src']} = {item['tgt']}" for item in entries]
+    return "\n[STRICT GLOSSARY - MUST USE THESE TRANSLATIONS]:\n" + "\n".join(g_list) + "\n"
+
+def _wordish(ch): return ch.isascii() and ch.isalnum()
+
+class GlossaryMatcher:
+    """Case-insensitive multi-pattern matcher over glossary entries' `field` ('src' or 'tgt'). ASCII terms must
+    match whole words; other scripts (which often have no spaces) match anywhere."""
+    def __init__(self, glossary, field='src'):
+        self.entries = [g for g in (glossary or []) if str(g.get(field, "")).strip()]
+        self.goto = [{}]; self.fail = [0]; self.out = [[]]; self.terms = []
+        for i, g in enumerate(self.entries):
+            term = str(g[field]).strip().lower(); self.terms.append(term); s = 0
+            for ch in term:
+                nxt = self.goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto); self.goto[s][ch] = nxt; self.goto.append({}); self.fail.append(0); self.out.append([])
+                s = nxt
+            self.out[s].append(i)
+        q = deque(self.goto[0].values())
+        while q:
+            s = q.popleft()
+            for ch, nxt in self.goto[s].items():
+                f = self.fail[s]
+                while f and ch not in self.goto[f]: f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+                q.append(nxt)
+
+    def __len__(self): return len(self.entries)
+
+    def find(self, text):
+        """Indices of entries whose term occurs in `text`."""
+        hits = set()
+        if not self.entries or not text: return hits
+        low = text.lower(); s = 0; goto = self.goto; fail = self.fail; out = self.out
+        for pos, ch in enumerate(low):
+            while s and ch not in goto[s]: s = fail[s]
+            s = goto[s].get(ch, 0)
+            for i in out[s]:
+                if i in hits: continue
+                term = self.terms[i]; a = pos - len(term) + 1
+                if _wordish(term[0]) and a > 0 and _wordish(low[a - 1]): continue
+                if _wordish(term[-1]) and pos + 1 < len(low) and _wordish(low[pos + 1]): continue
+                hits.add(i)
+        return hits
+
+    def select(self, texts):
+        hits = set()
+        for t in texts: hits |= self.find(t)
+        return [self.entries[i] for i in sorted(hits)]
+
+    def block(self, texts): return glossary_block(self.select(texts))
+
+    def violations(self, src, out):
+        """Entries required by `src` whose target term is missing from `out`."""
+        low = (out or "").lower()
+        return [self.entries[i] for i in sorted(self.find(src)) if str(self.entries[i]['tgt']).strip().lower() not in low]
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import time
+
+from tmcache import context_hash
+
+# --- 📓 JOB JOURNAL ---
+# One append-only JSONL file per job, keyed by source content hash + the
+# settings that decide what a translation looks like (languages, model,
+# glossary, instructions). Every landed batch is a
+# single small record, so a refresh, crash or server restart loses at most the
+# batch in flight. Replaying a journal rebuilds the job; long journals are
+# compacted into one snapshot record and stale ones are pruned.
+
+JOURNAL_DIR = "journals"
+COMPACT_AFTER = 200          # records before a journal is rewritten as a snapshot
+MAX_AGE_DAYS = 30
+
+def job_key(content_hash, settings, glossary=None):
+    blob = json.dumps([settings['source_lang'], settings['target_lang'], settings['model_name'], context_hash(glossary, settings.get('user_instr')),
+                       settings.get('analysis_instr') or ""], ensure_ascii=False)
+    return f"{content_hash[:20]}-{hashlib.sha1(blob.encode('utf-8')).hexdigest()[:10]}"
+
+def apply_record(job, rec):
+    t = rec.get('t')
+    if t == 'snapshot':
+        job['trans_map'] = dict(rec.get('m', {})); job['analysis'] = rec.get('analysis'); job['status'] = rec.get('status', 'paused')
+    elif t in ('cues', 'revision'): job['trans_map'].update(rec.get('m', {}))
+    elif t == 'drop':
+        for vid in rec.get('ids', []): job['trans_map'].pop(vid, None)
+    elif t == 'analysis': job['analysis'] = rec.get('text')
+
+class JobJournal:
+    def __init__(self, key, directory=JOURNAL_DIR):
+        self.key = key; self.path = os.path.join(directory, f"{key}.jsonl"); self.records = 0; self._fh = None
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self): return os.path.exists(self.path)
+
+    def replay(self, job):
+        """Applies every intact record to `job` (a new_job() dict) and returns it. A torn last line is ignored."""
+        self.records = 0
+        if self.exists():
+            with open(self.path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    try: rec = json.loads(line)
+                    except ValueError: break
+                    apply_record(job, rec); self.records += 1
+        job['done_ids'] = set(job['trans_map'])
+        return job
+
+    def _write(self, rec):
+        if self._fh is None: self._fh = open(self.path, "a", encoding="utf-8")
+        self._fh.write(json.dumps(rec, ensure_ascii=False, separators=(',', ':')) + "\n"); self._fh.flush()
+        self.records += 1
+
+    def cues(self, mapping):
+        if mapping: self._write({'t': 'cues', 'm': mapping})
+    def revision(self, mapping):
+        if mapping: self._write({'t': 'revision', 'm': mapping})
+    def drop(self, ids):
+        """Translations cleared by hand: the cues count as untranslated again on replay."""
+        if ids: self._write({'t': 'drop', 'ids': list(ids)})
+    def analysis(self, text): self._write({'t': 'analysis', 'text': text})
+
+    def compact(self, job):
+        """Rewrites the journal as a single snapshot of `job`."""
+        self.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(json.dumps({'t': 'snapshot', 'm': job['trans_map'], 'analysis': job.get('analysis'), 'status': job.get('status', 'paused'), 'ts': time.time()}, ensure_ascii=False, separators=(',', ':')) + "\n")
+            fh.flush(); os.fsync(fh.fileno())
+        os.replace(tmp, self.path); self.records = 1
+
+    def maybe_compact(self, job):
+        if self.records > COMPACT_AFTER: self.compact(job)
+
+    def close(self):
+        if self._fh: self._fh.close(); self._fh = None
+
+    def discard(self):
+        """Deletes the journal, so the job starts fresh."""
+        self.close()
+        try: os.remove(self.path)
+        except OSError: pass
+
+def prune(directory=JOURNAL_DIR, max_age_days=MAX_AGE_DAYS):
+    """Deletes journals not touched for `max_age_days`. Returns how many were removed."""
+    if not os.path.isdir(directory): return 0
+    cutoff = time.time() - max_age_days * 86400; removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith((".jsonl", ".tmp")) and os.path.getmtime(path) < cutoff:
+            try: os.remove(path); removed += 1
+            except OSError: pass
+    return removed
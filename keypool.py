@@ -0,0 +1,113 @@
+import asyncio
+import re
+import time
+from collections import deque
+
+# --- 🔑 MULTI-KEY POOL ---
+# Every saved key gets its own requests-per-minute and tokens-per-minute token
+# bucket. Budgets start from defaults (or what a previous run learned, never
+# above the configured limits), shrink to the observed rate when a key hits
+# 429, and creep back up on success, but never past the configured limit or
+# the budget that last drew a 429. A throttled key backs off alone while the
+# rest keep serving batches.
+
+DEFAULT_RPM = 15
+DEFAULT_TPM = 1_000_000
+MAX_STRIKES = 4          # consecutive 429s before a key counts as exhausted
+MAX_BACKOFF = 120.0
+RPM_STEP = 0.25          # requests/minute regained per successful call
+TPM_STEP = 0.01          # share of the configured tokens/minute regained per successful call
+WINDOW = 60.0
+
+class QuotaExceeded(Exception): pass
+
+def is_rate_limit(e):
+    msg = str(e).lower()
+    return "429" in msg or "resource_exhausted" in msg or "rate limit" in msg
+
+def retry_delay(e):
+    m = re.search(r"retry(?:_?delay|[- ]after)['\"]?\s*[:=]?\s*['\"]?(\d+(?:\.\d+)?)s?", str(e), re.IGNORECASE)
+    return float(m.group(1)) if m else None
+
+def mask(key): return f"{key[:6]}...{key[-4:]}"
+
+class KeySlot:
+    def __init__(self, key, client, rpm, tpm, max_rpm=None, max_tpm=None):
+        # `max_rpm`/`max_tpm`: ceilings the budgets may grow back to (the configured limits, lowered by each 429).
+        self.max_rpm = float(max_rpm or rpm); self.max_tpm = float(max_tpm or tpm); self.tpm_step = self.max_tpm * TPM_STEP
+        self.key = key; self.client = client; self.rpm = min(float(rpm), self.max_rpm); self.tpm = min(float(tpm), self.max_tpm)
+        self.req_bucket = self.rpm; self.tok_bucket = self.tpm; self.last = time.monotonic()
+        self.blocked_until = 0.0; self.strikes = 0; self.inflight = 0
+        self.history = deque()   # [time, tokens] of requests in the last minute
+        self.requests = 0; self.rate_limits = 0
+
+    def refill(self, now):
+        dt = now - self.last; self.last = now
+        self.req_bucket = min(self.rpm, self.req_bucket + dt * self.rpm / WINDOW)
+        self.tok_bucket = min(self.tpm, self.tok_bucket + dt * self.tpm / WINDOW)
+        while self.history and now - self.history[0][0] > WINDOW: self.history.popleft()
+
+    def wait_time(self, now, est_tokens):
+        # Seconds until this key can take a request of `est_tokens`.
+        need = min(est_tokens, self.tpm)
+        w_req = max(0.0, (1 - self.req_bucket) * WINDOW / self.rpm)
+        w_tok = max(0.0, (need - self.tok_bucket) * WINDOW / self.tpm)
+        return max(self.blocked_until - now, w_req, w_tok)
+
+    def observed(self):
+        return len(self.history), sum(t for _, t in self.history)
+
+class KeyPool:
+    def __init__(self, keys, client_factory, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, limits=None):
+        limits = limits or {}
+        self.slots = []
+        for k in dict.fromkeys(keys):
+            learned = limits.get(k, {})
+            self.slots.append(KeySlot(k, client_factory(k), learned.get('rpm', rpm), learned.get('tpm', tpm), max_rpm=rpm, max_tpm=tpm))
+        if not self.slots: raise ValueError("KeyPool needs at least one API key.")
+
+    async def acquire(self, est_tokens, exclude=()):
+        """(slot, ticket): a slot with budget for `est_tokens`, waiting if needed, and the ticket that settles this request's
+        history entry in release(). Slots in `exclude` are never handed out."""
+        while True:
+            now = time.monotonic()
+            live = [s for s in self.slots if s.strikes < MAX_STRIKES and s not in exclude]
+            if not live: raise QuotaExceeded("Quota Exceeded (429) on all keys.")
+            for s in live: s.refill(now)
+            best = min(live, key=lambda s: (s.wait_time(now, est_tokens), s.inflight))
+            wait = best.wait_time(now, est_tokens)
+            if wait <= 0:
+                best.req_bucket -= 1; best.tok_bucket -= min(est_tokens, best.tpm)
+                ticket = [now, est_tokens]; best.inflight += 1; best.requests += 1; best.history.append(ticket)
+                return best, ticket
+            await asyncio.sleep(min(wait, 5.0))
+
+    def release(self, slot, est_tokens, used_tokens=None, ticket=None):
+        slot.inflight = max(0, slot.inflight - 1)
+        if used_tokens is None: return
+        # Settle the estimate against the real usage_metadata count.
+        slot.tok_bucket -= used_tokens - min(est_tokens, slot.tpm)
+        if ticket is not None: ticket[1] = used_tokens   # this request's own entry, not whichever was reserved last
+        slot.strikes = 0
+        # Additive increase up to the ceiling, multiplicative back-off on 429 (penalize).
+        slot.rpm = min(slot.max_rpm, slot.rpm + RPM_STEP); slot.tpm = min(slot.max_tpm, slot.tpm + slot.tpm_step)
+
+    def penalize(self, slot, e):
+        """Learns a lower budget for `slot` after a 429 and blocks it for a while. Returns the back-off in seconds."""
+        slot.inflight = max(0, slot.inflight - 1); slot.strikes += 1; slot.rate_limits += 1
+        now = time.monotonic(); slot.refill(now)
+        reqs, toks = slot.observed()
+        # Settle near the rate actually observed, but never more than halve in one step.
+        # The budget that drew the 429 becomes the ceiling additive increase climbs back towards.
+        if "token" in str(e).lower(): slot.max_tpm = min(slot.max_tpm, slot.tpm); slot.tpm = max(1000.0, min(slot.tpm, max(toks, slot.tpm / 2)) * 0.9)
+        else: slot.max_rpm = min(slot.max_rpm, slot.rpm); slot.rpm = max(1.0, min(slot.rpm, max(reqs, slot.rpm / 2)) * 0.9)
+        slot.req_bucket = min(slot.req_bucket, 0.0); slot.tok_bucket = min(slot.tok_bucket, 0.0)
+        backoff = retry_delay(e) or min(MAX_BACKOFF, 5.0 * 2 ** (slot.strikes - 1))
+        slot.blocked_until = now + backoff
+        return backoff
+
+    def limits(self):
+        return {s.key: {'rpm': round(s.rpm, 2), 'tpm': int(s.tpm)} for s in self.slots}
+
+    def summary(self):
+        return [{'key': mask(s.key), 'rpm': round(s.rpm, 1), 'tpm': int(s.tpm), 'requests': s.requests, 'rate_limits': s.rate_limits, 'exhausted': s.strikes >= MAX_STRIKES} for s in self.slots]
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import time
+from google import genai
+from google.genai import types
+
+from subtitles import load_subtitle, content_hash
+from engine import TranslationEngine, StreamParser, JsonCueParser, id_key, is_truncated, structured_config
+from keypool import KeyPool, DEFAULT_RPM, DEFAULT_TPM, is_rate_limit, retry_delay
+from tmcache import TranslationMemory, tm_scope
+from exports import bump
+from journal import JobJournal, job_key
+from analysis import AnalysisCache, analyze
+from glossary import GlossaryMatcher
+from promptcache import PromptCache
+from telemetry import Telemetry
+
+# --- 🧩 PIPELINE ---
+# Streamlit-free building blocks shared by app.py and cli.py: settings,
+# prompts, analysis, the translation engine setup, revision and the one-file
+# headless run.
+
+SETTINGS_FILE = "gemini_settings.json"
+REVISION_WINDOW = 120        # cues a revision request owns
+REVISION_OVERLAP = 8         # neighbouring cues shown on each side for context
+
+DEFAULT_SETTINGS = {
+    "api_keys": [], "active_key": None,
+    "model_name": "gemini-2.0-flash", "source_lang": "English", "target_lang": "Roman Hindi",
+    "batch_sz": 20, "temp_val": 0.3, "max_tok_val": 65536,
+    "enable_memory": True, "enable_analysis": False, "enable_revision": False,
+    "user_instr": "Translate into natural Roman Hindi. Keep Anime terms in English.", "analysis_instr": "", "revision_instr": "",
+    "concurrency": 4, "key_rpm": DEFAULT_RPM, "key_tpm": DEFAULT_TPM,
+    "enable_tm": True, "enable_dedup": True, "dedup_keep_short": True, "adaptive_batch": True, "series_name": "", "enable_prompt_cache": True, "structured_output": False, "scene_gap": 2.5,
+    "enable_hedging": False, "hedge_pct": 0.95, "fallback_model": "",
+}
+
+def load_settings_file(path=SETTINGS_FILE):
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(path):
+        with open(path, "r") as f: settings.update(json.load(f))
+    return settings
+
+def key_order(settings):
+    keys = ([settings['active_key']] if settings.get('active_key') else []) + list(settings.get('api_keys') or [])
+    return list(dict.fromkeys(keys))
+
+def fresh_clients(key):
+    """Client factory for analyze() and revise(): each call gets a new genai.Client, because a client's `aio` surface is
+    bound to the first event loop it runs in and every such call runs its own asyncio.run()."""
+    return lambda: genai.Client(api_key=key)
+
+def new_job(): return {'status': 'paused', 'done_ids': set(), 'trans_map': {}, 'analysis': None}
+
+def revision_windows(ids, size=REVISION_WINDOW, overlap=REVISION_OVERLAP):
+    """[(core_ids, window_ids)]: consecutive cores of `size` IDs, each padded by `overlap` IDs of its neighbours."""
+    out = []
+    for a in range(0, len(ids), size):
+        out.append((ids[a:a + size], ids[max(0, a - overlap):a + size + overlap]))
+    return out
+
+def merge_revisions(edits, windows, trans_map):
+    """`edits`: {window_no: {id: text}}. The window that owns an ID (has it in its core) wins; otherwise the edit
+    made with the most surrounding context (farthest from its window's edge) wins, earlier windows on ties.
+    A window that stays silent about a line is not a vote to keep it, since only changed lines come back."""
+    best = {}
+    for w, changed in edits.items():
+        core, window = windows[w]; core_ids = set(core); pos = {vid: i for i, vid in enumerate(window)}
+        for vid, txt in changed.items():
+            if vid not in pos or not txt or txt == trans_map.get(vid): continue
+            rank = (1 if vid in core_ids else 0, min(pos[vid], len(window) - 1 - pos[vid]), -w)
+            if vid not in best or rank > best[vid][0]: best[vid] = (rank, txt)
+    return {vid: txt for vid, (_, txt) in best.items()}
+
+def _revision_prompt(settings, context, glossary_note, draft):
+    out = ('A JSON array of {"id": "<ID>", "t": "<fixed text>"}, ONLY for lines you changed. Do not repeat unchanged lines. If nothing needs fixing, output [].'
+           if settings.get('structured_output') else "[ID] Fixed Text, ONLY for lines you changed. Do not repeat unchanged lines. If nothing needs fixing, output NONE.")
+    return (f"ROLE: Editor.\nTASK: Polish grammar/flow.\nCONTEXT: {context}\n{glossary_note}\nNOTE: {settings['revision_instr']}\n"
+            f"INPUT FORMAT: [ID] Text\nOUTPUT FORMAT: {out}\n\n{draft}")
+
+async def _revise_windows(client, settings, trans_map, windows, context, glossary, on_delta, stats, tel):
+    sem = asyncio.Semaphore(max(1, settings.get('concurrency', 4))); edits = {}
+    structured = bool(settings.get('structured_output'))
+    config = (structured_config if structured else types.GenerateContentConfig)(temperature=0.3, max_output_tokens=settings['max_tok_val'])
+    async def one(w):
+        core, window = windows[w]; ids = set(window)
+        terms = glossary.select([trans_map[vid] for vid in window])
+        glossary_note = "\n[CRITICAL: DO NOT CHANGE THESE TERMS]:\n" + "\n".join([f"- {item['tgt']}" for item in terms]) if terms else ""
+        prompt = _revision_prompt(settings, context, glossary_note, "\n\n".join([f"[{vid}]\n{trans_map[vid]}" for vid in window]))
+        async with sem:
+            for attempt in range(3):
+                parser = JsonCueParser() if structured else StreamParser(); got = {}; truncated = False; usage = None; t0 = time.monotonic(); t_first = None
+                try:
+                    stream = await client.aio.models.generate_content_stream(model=settings['model_name'], contents=prompt, config=config)
+                    async for c in stream:
+                        if t_first is None: t_first = time.monotonic()
+                        if c.text:
+                            if on_delta: on_delta(w, c.text)
+                            for rid, rtxt in parser.feed(c.text):
+                                if rid in ids: got[rid] = rtxt
+                        if c.usage_metadata: usage = c.usage_metadata
+                        if is_truncated(c): truncated = True
+                    if not truncated:
+                        for rid, rtxt in parser.close():
+                            if rid in ids: got[rid] = rtxt
+                except Exception as e:
+                    tel(w, t0, t_first, usage, len(window), len(got), '429' if is_rate_limit(e) else 'error', attempt)
+                    if is_rate_limit(e) and attempt < 2: d = retry_delay(e); await asyncio.sleep(5 * (attempt + 1) if d is None else d); continue
+                    stats['failed'] += 1; edits[w] = got; return
+                tel(w, t0, t_first, usage, len(window), len(got), 'truncated' if truncated else 'ok', attempt)
+                break
+            stats['output_tokens'] += (usage.candidates_token_count or 0) if usage else 0
+            if truncated: stats['truncated'] += 1
+            edits[w] = got
+    # Client.__exit__ only closes the sync transport, so the async one is closed here, inside the loop that opened it.
+    try: await asyncio.gather(*[one(w) for w in range(len(windows))])
+    finally: await client.aio.aclose()
+    return edits
+
+def revise(client_factory, settings, trans_map, context, glossary, on_delta=None, telemetry=None, name=""):
+    """Polishes `trans_map` in place over overlapping windows revised in parallel; the model returns only the lines it
+    changes. `client_factory()` gives a fresh client for this call's event loop (see analysis.analyze).
+    `on_delta(window_no, text)` streams each window. Returns a stats dict ('changed', 'failed', 'pct', 'latency', ...)."""
+    t0 = time.monotonic(); sorted_ids = sorted(trans_map.keys(), key=id_key)
+    windows = revision_windows(sorted_ids)
+    stats = {'windows': len(windows), 'failed': 0, 'truncated': 0, 'output_tokens': 0}
+    def tel(w, t0, t_first, usage, cues, accepted, status, attempt):
+        if telemetry: telemetry.record('revision', name, f"window {w + 1}", t0, t_first, usage, cues, accepted, status, attempt)
+    with client_factory() as client:
+        edits = asyncio.run(_revise_windows(client, settings, trans_map, windows, context, GlossaryMatcher(glossary, 'tgt'), on_delta, stats, tel))
+    merged = merge_revisions(edits, windows, trans_map); trans_map.update(merged)
+    stats.update(changed=len(merged), total=len(sorted_ids), pct=100.0 * len(merged) / max(1, len(sorted_ids)), latency=time.monotonic() - t0)
+    return stats
+
+def make_engine(settings, glossary, keys, client_factory=None, key_limits=None, rate_share=1.0, telemetry=None):
+    """TranslationEngine over a KeyPool of `keys`. `rate_share` scales each key's budget when several processes share the keys."""
+    client_factory = client_factory or (lambda k: genai.Client(api_key=k))
+    pool = KeyPool(keys, client_factory, rpm=max(1.0, settings['key_rpm'] * rate_share), tpm=max(1000.0, settings['key_tpm'] * rate_share), limits=key_limits)
+    tm = TranslationMemory() if settings['enable_tm'] else None
+    prompt_cache = PromptCache(settings['model_name']) if settings.get('enable_prompt_cache') else None
+    # The fallback model has its own quota on the same keys (and clients), so it gets its own budgets.
+    clients = {s.key: s.client for s in pool.slots}
+    fallback_pool = KeyPool(keys, clients.get, rpm=max(1.0, settings['key_rpm'] * rate_share), tpm=max(1000.0, settings['key_tpm'] * rate_share)) if settings.get('fallback_model') else None
+    return TranslationEngine(pool, settings, glossary=GlossaryMatcher(glossary), concurrency=settings['concurrency'], tm=tm, tm_scope=tm_scope(settings, glossary),
+                             dedup=settings['enable_dedup'], dedup_keep_short=settings['dedup_keep_short'], adaptive=settings['adaptive_batch'], prompt_cache=prompt_cache, telemetry=telemetry,
+                             fallback_pool=fallback_pool)
+
+def _marker_path(path):
+    d, n = os.path.split(path)
+    return os.path.join(d, f".{n}.translated")
+
+def translated_in_place(path, data):
+    """True when `data` is exactly what an in-place run wrote to `path` (its sidecar marker holds that content hash)."""
+    try:
+        with open(_marker_path(path), "r", encoding="utf-8") as fh: return json.load(fh).get('hash') == content_hash(data)
+    except (OSError, ValueError): return False
+
+def translate_path(path, settings, glossary=None, out_path=None, rate_share=1.0, log=print):
+    """Headless run for one subtitle file: analysis -> translation -> revision -> write. Resumes from the file's journal.
+    Writing over the source (`out_path == path`) leaves a sidecar marker, so a rerun skips the translated file instead of
+    taking it for a new source. Returns a summary dict ('skipped' set for such files); 'calls' holds the per-call
+    telemetry records."""
+    t0 = time.monotonic(); name = os.path.basename(path)
+    with open(path, "rb") as fh: data = fh.read()
+    proc = load_subtitle(name, data)
+    if out_path == path and translated_in_place(path, data):
+        log(f"{name}: already translated in place, skipping")
+        return {'file': path, 'out': path, 'cues': len(proc.lines), 'translated': len(proc.lines), 'tokens': 0, 'seconds': round(time.monotonic() - t0, 2), 'calls': [], 'skipped': True}
+    keys = key_order(settings)
+    if not keys: raise ValueError("No API keys in settings.")
+    glossary = glossary or []; journal = JobJournal(job_key(content_hash(data), settings, glossary)); job = journal.replay(new_job())
+    glossary_text = GlossaryMatcher(glossary).block([x.txt for x in proc.lines]); tokens = 0; tel = Telemetry()
+    if job['status'] == 'completed': log(f"{name}: already completed in journal, rewriting output")
+    else:
+        if job['trans_map']: log(f"{name}: resuming, {len(job['trans_map'])}/{len(proc.lines)} cues from journal")
+        new_client = fresh_clients(keys[0])
+        context = job['analysis'] or "No analysis requested."
+        if settings['enable_analysis'] and not job['analysis']:
+            try: context = analyze(new_client, settings, proc.lines, glossary_text, cache=AnalysisCache(), telemetry=tel, name=name); job['analysis'] = context; journal.analysis(context)
+            except Exception as e: log(f"{name}: analysis failed: {e}"); context = "Failed."
+        engine = make_engine(settings, glossary, keys, rate_share=rate_share, telemetry=tel)
+        try: asyncio.run(engine.run([{'name': name, 'lines': proc.lines, 'job': job, 'context': context, 'journal': journal}], on_notice=lambda kind, msg: log(f"{name}: {msg}")))
+        finally:
+            journal.close(); tokens = engine.total_tokens
+            if engine.tm: engine.tm.close()
+        if settings['enable_revision'] and job['trans_map']:
+            try:
+                rs = revise(new_client, settings, job['trans_map'], context, glossary, telemetry=tel, name=name)
+                if rs['failed']: log(f"{name}: revision: {rs['failed']}/{rs['windows']} window(s) failed")
+                log(f"{name}: revision changed {rs['changed']}/{rs['total']} lines ({rs['pct']:.1f}%) in {rs['latency']:.1f}s, {rs['output_tokens']} output tokens")
+            except Exception as e: log(f"{name}: revision skipped: {e}")
+            bump(job)
+        job['status'] = 'completed'; journal.compact(job)
+    out_path = out_path or os.path.join(os.path.dirname(path), f"trans_{name}")
+    with open(out_path, "w", encoding="utf-8") as fh: fh.write(proc.get_output(job['trans_map']))
+    if out_path == path:
+        with open(out_path, "rb") as fh: written = fh.read()
+        with open(_marker_path(path), "w", encoding="utf-8") as fh: json.dump({'hash': content_hash(written), 'source': content_hash(data), 'journal': journal.key}, fh)
+    return {'file': path, 'out': out_path, 'cues': len(proc.lines), 'translated': len(job['trans_map']), 'tokens': tokens, 'seconds': round(time.monotonic() - t0, 2), 'calls': tel.records}
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from google.genai import types
+
+# --- 🧊 PROMPT PREFIX CACHE ---
+# A file's static prompt prefix (role, analysis context, glossary, instructions)
+# is registered once per API key as cached content and referenced by handle,
+# so batches only send [PREVIOUS CONTEXT] + [INPUT]. Handles are refreshed
+# before their TTL runs out and deleted when the run ends. A handle that
+# expires or is evicted mid-run is recreated once; anything else that goes
+# wrong (prefix too small to cache, unsupported model, the recreated handle
+# failing too) falls back to plain full prompts for that file on that key, and
+# the handle is deleted server-side so it does not sit out its TTL.
+
+CACHE_TTL = 900               # seconds a cache lives without a refresh
+CACHE_REFRESH = 120           # refresh when less than this is left
+MIN_CACHE_TOKENS = 2048       # smaller prefixes are cheaper to resend than to cache
+
+def is_cache_error(e):
+    """True when a request failed because of its cached-content handle (expired, deleted, unknown), not e.g. a 5xx."""
+    msg = str(e).lower()
+    return "cachedcontent" in msg or "cached_content" in msg or "cached content" in msg
+
+class PromptCache:
+    def __init__(self, model, ttl=CACHE_TTL, min_tokens=MIN_CACHE_TOKENS, clock=time.monotonic):
+        self.model = model; self.ttl = ttl; self.min_tokens = min_tokens; self.clock = clock
+        self.handles = {}; self.locks = {}; self.disabled = set(); self.stale = []   # (name, client) whose delete failed
+        self.recreated = set()   # keys whose handle was already lost once and remade
+        self.created = 0; self.refreshed = 0; self.recreates = 0; self.used = 0; self.fallbacks = 0; self.errors = []
+
+    async def handle(self, slot, file_key, system_text, est_tokens):
+        """Cache name for `system_text` on `slot`'s key, or None to send the full prompt."""
+        key = (slot.key, file_key)
+        if key in self.disabled or est_tokens < self.min_tokens: self.fallbacks += 1; return None
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            h = self.handles.get(key); now = self.clock()
+            if h and h[1] <= now: del self.handles[key]; h = None   # ran out its TTL while the key sat idle: make a new one
+            try:
+                if h and h[1] - now < CACHE_REFRESH:
+                    try:
+                        await slot.client.aio.caches.update(name=h[0], config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"))
+                        h = self.handles[key] = (h[0], now + self.ttl, slot.client); self.refreshed += 1
+                    except Exception as e:
+                        if not is_cache_error(e) or key in self.recreated: raise
+                        await self._lost(key); h = None   # gone server-side: remade below
+                if not h:
+                    c = await slot.client.aio.caches.create(model=self.model, config=types.CreateCachedContentConfig(system_instruction=system_text, ttl=f"{self.ttl}s", display_name=f"subs-{file_key}"[:120]))
+                    h = self.handles[key] = (c.name, now + self.ttl, slot.client); self.created += 1
+            except Exception as e:
+                self.disabled.add(key); self.errors.append(str(e)); self.fallbacks += 1
+                await self._drop(key)
+                return None
+        self.used += 1
+        return h[0]
+
+    async def invalidate(self, slot, file_key):
+        # A request with this handle failed (e.g. the cache expired server-side). The next handle() remakes it once; if
+        # the remade one fails too, this file uses plain prompts on this key from now on.
+        key = (slot.key, file_key)
+        if key in self.recreated: self.disabled.add(key); await self._drop(key)
+        else: await self._lost(key)
+
+    async def _lost(self, key):
+        self.recreated.add(key); self.recreates += 1
+        await self._drop(key)
+
+    async def _drop(self, key):
+        h = self.handles.pop(key, None)
+        if not h: return
+        try: await h[2].aio.caches.delete(name=h[0])
+        except Exception: self.stale.append((h[0], h[2]))   # retried by close()
+
+    async def close(self):
+        handles = [(name, client) for name, _, client in self.handles.values()] + self.stale; self.handles.clear(); self.stale = []
+        for name, client in handles:
+            try: await client.aio.caches.delete(name=name)
+            except Exception: pass
+
+    def summary(self): return {'created': self.created, 'refreshed': self.refreshed, 'recreated': self.recreates, 'batches': self.used, 'fallbacks': self.fallbacks}
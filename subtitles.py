@@ -0,0 +1,130 @@
+import hashlib
+import os
+import re
+from collections import OrderedDict
+
+# --- 🎞️ SUBTITLE PARSING ---
+# One pass per format into compact __slots__ cues. Timestamps are parsed to
+# integer milliseconds on first access (most reruns never look at them) and
+# cached on the cue. Parsed files are memoized by content hash + format, so Streamlit
+# reruns, the editor and the download section all share one parse. Cached
+# processors are shared: never mutate their cues, use `with_edits()` instead.
+# `split_scenes()` cuts a cue list into scenes at silences of SCENE_GAP_MS or more.
+
+PARSE_CACHE_SIZE = 64
+SRT_BLOCK_RE = re.compile(r'\n\s*\n')
+TS_RE = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{1,2})[.,](\d{1,3})')
+
+def ts_to_ms(ts):
+    """'01:02:03,450' (srt), '02:03.450' (vtt) or '1:02:03.45' (ass) -> milliseconds."""
+    ts = (ts or "").strip()
+    if len(ts) == 12 and ts[2] == ':' and ts[5] == ':' and ts[8] in ',.' and ts[:2].isdigit() and ts[3:5].isdigit() and ts[6:8].isdigit() and ts[9:].isdigit():
+        return int(ts[:2]) * 3600000 + int(ts[3:5]) * 60000 + int(ts[6:8]) * 1000 + int(ts[9:])
+    m = TS_RE.search(ts)
+    if not m: return None
+    h, mi, s, frac = m.groups()
+    return ((int(h or 0) * 60 + int(mi)) * 60 + int(s)) * 1000 + int(frac.ljust(3, '0'))
+
+def timing_to_ms(t):
+    if not t or '-->' not in t: return None, None
+    a, b = t.split('-->', 1); b = b.split()
+    return ts_to_ms(a), ts_to_ms(b[0] if b else "")
+
+SCENE_GAP_MS = 2500
+
+def split_scenes(lines, gap_ms=SCENE_GAP_MS):
+    """Start indices of the scenes in `lines`: a scene starts after at least `gap_ms` of silence. Untimed cues never split."""
+    starts = [0] if lines else []; last_end = None
+    for i, x in enumerate(lines):
+        s = x.start
+        if i and s is not None and last_end is not None and s - last_end >= gap_ms: starts.append(i)
+        e = x.end
+        if e is not None and (last_end is None or e > last_end): last_end = e
+    return starts
+
+class Cue:
+    """`t`: srt/vtt timing line; `head`: the first nine .ass fields (with trailing comma)."""
+    __slots__ = ('id', 'txt', 't', 'head', '_ms')
+    def __init__(self, id, txt, t=None, head=None):
+        self.id = id; self.txt = txt; self.t = t; self.head = head; self._ms = None
+    def _times(self):
+        if self._ms is None:
+            if self.head is not None: p = self.head.split(',', 3); self._ms = (ts_to_ms(p[1]), ts_to_ms(p[2])) if len(p) > 3 else (None, None)
+            else: self._ms = timing_to_ms(self.t)
+        return self._ms
+    @property
+    def start(self): return self._times()[0]
+    @property
+    def end(self): return self._times()[1]
+    def with_text(self, txt):
+        c = Cue(self.id, txt, self.t, self.head); c._ms = self._ms
+        return c
+    def __repr__(self): return f"Cue({self.id!r}, {self.txt!r})"
+
+class SubtitleProcessor:
+    def __init__(self, filename, content_bytes):
+        self.ext = os.path.splitext(filename)[1].lower()
+        try: self.raw = content_bytes.decode('utf-8').replace('\r\n', '\n')
+        except: self.raw = content_bytes.decode('latin-1').replace('\r\n', '\n')
+        self.lines = []; self.layout = []   # layout: .ass lines, with an int index where a cue goes
+    def parse(self):
+        if self.ext == '.srt': self.srt()
+        elif self.ext == '.vtt': self.vtt()
+        elif self.ext == '.ass': self.ass()
+        return len(self.lines)
+    def srt(self):
+        append = self.lines.append
+        for b in SRT_BLOCK_RE.split(self.raw.strip()):
+            l = b.split('\n', 2)
+            if len(l) == 3: append(Cue(l[0].strip(), l[2], l[1].strip()))
+    def vtt(self):
+        t = None; txt = []; cnt = 1; lines = self.raw.split('\n')
+        if lines and lines[0].strip() == "WEBVTT": lines = lines[1:]
+        for l in lines:
+            l = l.strip()
+            if "-->" in l: t = l; cid = str(cnt); cnt += 1
+            elif l == "" and t:
+                if txt: self.lines.append(Cue(cid, "\n".join(txt), t))
+                t = None; txt = []
+            elif t: txt.append(l)
+        if t and txt: self.lines.append(Cue(cid, "\n".join(txt), t))
+    def ass(self):
+        cnt = 1
+        for l in self.raw.split('\n'):
+            if l.startswith("Dialogue:"):
+                p = l.split(',', 9)
+                if len(p) == 10:
+                    self.layout.append(len(self.lines))
+                    self.lines.append(Cue(str(cnt), p[9].strip(), None, l[:len(l) - len(p[9])]))
+                    cnt += 1; continue
+            self.layout.append(l)
+    def with_edits(self, edits):
+        """Cue list with `edits` ({id: text}) applied, leaving the (possibly cached) originals untouched."""
+        return [x.with_text(edits[x.id]) if x.id in edits else x for x in self.lines]
+    def get_output(self, data):
+        if self.ext == '.srt':
+            return "".join([f"{x.id}\n{x.t}\n{data.get(x.id, x.txt)}\n\n" for x in self.lines])
+        if self.ext == '.vtt':
+            return "WEBVTT\n\n" + "".join([f"{x.t}\n{data.get(x.id, x.txt)}\n\n" for x in self.lines])
+        if self.ext == '.ass':
+            out = []
+            for item in self.layout:
+                if item.__class__ is int: x = self.lines[item]; out.append(x.head + data.get(x.id, x.txt))
+                else: out.append(item)
+            return "\n".join(out) + "\n"
+        return ""
+
+_parse_cache = OrderedDict()
+
+def content_hash(content_bytes): return hashlib.sha1(content_bytes).hexdigest()
+
+def load_subtitle(filename, content_bytes):
+    """Parsed SubtitleProcessor for `content_bytes`, memoized by content hash + format."""
+    key = (content_hash(content_bytes), os.path.splitext(filename)[1].lower())
+    proc = _parse_cache.get(key)
+    if proc is None:
+        proc = SubtitleProcessor(filename, content_bytes); proc.parse()
+        _parse_cache[key] = proc
+        while len(_parse_cache) > PARSE_CACHE_SIZE: _parse_cache.popitem(last=False)
+    else: _parse_cache.move_to_end(key)
+    return proc
@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+import time
+from collections import deque
+
+# --- 📈 RUN TELEMETRY ---
+# One record per model call (analysis, translation, revision): wall time, time
+# to first chunk, prompt/completion/cached tokens, output tokens/second, cues
+# sent and accepted, how the call ended (ok, 429, error, truncated,
+# cancelled, ...), whether it was a hedged duplicate, the batch's end-to-end
+# time on the call that landed it and, for a primary beaten by its hedge, the
+# tail latency the hedge saved.
+# Feeds the live throughput/ETA line and exports as CSV or JSON.
+
+FIELDS = ['stage', 'file', 'label', 'attempt', 'status', 'start_s', 'wall_s', 'ttfc_s', 'prompt_tokens', 'output_tokens',
+          'cached_tokens', 'output_tps', 'cues', 'accepted', 'model', 'hedge', 'batch_s', 'saved_s']
+ROLLING_WINDOW = 60.0
+
+def _fmt_eta(secs):
+    if secs is None: return "—"
+    secs = int(secs)
+    return f"{secs // 3600}h {secs % 3600 // 60:02d}m" if secs >= 3600 else f"{secs // 60}m {secs % 60:02d}s"
+
+class Telemetry:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock; self.t0 = clock(); self.records = []; self._done = deque()   # (end time, accepted cues) for the rolling rate
+
+    def record(self, stage, file, label, t_start, t_first=None, usage=None, cues=0, accepted=0, status='ok', attempt=0, model="", hedge=False, batch_s=None, saved_s=None):
+        now = self.clock(); out = (getattr(usage, 'candidates_token_count', 0) or 0) if usage else 0
+        gen_time = now - t_first if t_first else 0.0
+        rec = {'stage': stage, 'file': file, 'label': str(label), 'attempt': attempt, 'status': status,
+               'start_s': round(t_start - self.t0, 3), 'wall_s': round(now - t_start, 3), 'ttfc_s': round(t_first - t_start, 3) if t_first else None,
+               'prompt_tokens': (getattr(usage, 'prompt_token_count', 0) or 0) if usage else 0, 'output_tokens': out,
+               'cached_tokens': (getattr(usage, 'cached_content_token_count', 0) or 0) if usage else 0,
+               'output_tps': round(out / gen_time, 1) if out and gen_time > 0 else None, 'cues': cues, 'accepted': accepted, 'model': model, 'hedge': hedge,
+               'batch_s': round(batch_s, 3) if batch_s is not None else None, 'saved_s': saved_s}
+        self.records.append(rec)
+        if stage == 'translate' and accepted: self._done.append((now, accepted))
+        return rec
+
+    def rate(self, window=ROLLING_WINDOW):
+        """Accepted translation cues/second over the last `window` seconds."""
+        now = self.clock()
+        while self._done and now - self._done[0][0] > window: self._done.popleft()
+        if not self._done: return 0.0
+        span = min(window, now - self.t0)
+        return sum(n for _, n in self._done) / span if span > 0 else 0.0
+
+    def eta(self, remaining):
+        r = self.rate()
+        return remaining / r if r > 0 else None
+
+    def progress_line(self, done, total):
+        return f"✅ {done} / {total} cues · {self.rate():.1f} cues/s (last {ROLLING_WINDOW:.0f}s) · ETA {_fmt_eta(self.eta(max(0, total - done)))}"
+
+    def summary(self):
+        """Per-stage aggregates. `wall_p95_s`/`wall_max_s` are end-to-end batch times where the stage records them (a hedged
+        batch counts from its primary's start), else the wall time of calls that ran to the end; `hedge_saved_s` sums the
+        tail latency winning hedges saved."""
+        rows = {}
+        for r in self.records:
+            s = rows.setdefault(r['stage'], {'stage': r['stage'], 'calls': 0, 'ok': 0, 'rate_limited': 0, 'errors': 0, 'retries': 0, 'wall_s': 0.0,
+                                             'prompt_tokens': 0, 'output_tokens': 0, 'cached_tokens': 0, 'cues': 0, 'accepted': 0, 'cancelled': 0, 'hedges': 0, 'hedge_saved_s': 0.0, 'models': {}, '_ttfc': [], '_tps': [], '_wall': [], '_batch': []})
+            s['calls'] += 1; s['ok'] += r['status'] == 'ok'; s['rate_limited'] += r['status'] == '429'; s['errors'] += r['status'] == 'error'
+            s['retries'] += r['attempt'] > 0; s['wall_s'] += r['wall_s']; s['cancelled'] += r['status'] == 'cancelled'
+            if r['status'] != 'cancelled': s['_wall'].append(r['wall_s'])
+            if r['batch_s'] is not None: s['_batch'].append(r['batch_s'])
+            s['hedges'] += bool(r['hedge'])
+            if r['saved_s']: s['hedge_saved_s'] += r['saved_s']
+            if r['model']: s['models'][r['model']] = s['models'].get(r['model'], 0) + 1
+            for k in ('prompt_tokens', 'output_tokens', 'cached_tokens', 'cues', 'accepted'): s[k] += r[k]
+            if r['ttfc_s'] is not None: s['_ttfc'].append(r['ttfc_s'])
+            if r['output_tps']: s['_tps'].append(r['output_tps'])
+        out = []
+        for s in rows.values():
+            ttfc = sorted(s.pop('_ttfc')); tps = s.pop('_tps'); walls = s.pop('_wall'); wall = sorted(s.pop('_batch') or walls)
+            s['wall_s'] = round(s['wall_s'], 2); s['hedge_saved_s'] = round(s['hedge_saved_s'], 2)
+            s['ttfc_p50_s'] = ttfc[len(ttfc) // 2] if ttfc else None
+            s['ttfc_p95_s'] = ttfc[min(len(ttfc) - 1, int(len(ttfc) * 0.95))] if ttfc else None
+            s['wall_p95_s'] = wall[min(len(wall) - 1, int(len(wall) * 0.95))] if wall else None
+            s['wall_max_s'] = wall[-1] if wall else None
+            s['output_tps_avg'] = round(sum(tps) / len(tps), 1) if tps else None
+            s['cues_per_call'] = round(s['cues'] / s['calls'], 1) if s['calls'] else 0
+            out.append(s)
+        return out
+
+    def to_csv(self):
+        buf = io.StringIO(); w = csv.DictWriter(buf, fieldnames=FIELDS); w.writeheader(); w.writerows(self.records)
+        return buf.getvalue()
+
+    def to_json(self): return json.dumps({'summary': self.summary(), 'calls': self.records}, indent=2)
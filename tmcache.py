@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# --- 🗃️ TRANSLATION MEMORY ---
+# SQLite cache of source text -> translation, scoped by language pair, model and
+# a hash of the glossary + user instruction. Lookups refresh `used`, and the
+# oldest rows are evicted once the table grows past `max_entries`.
+
+TM_FILE = "translation_memory.db"
+TM_MAX_ENTRIES = 200_000
+
+def context_hash(glossary, user_instr):
+    blob = json.dumps([[g['src'], g['tgt']] for g in glossary or []], ensure_ascii=False) + "\x00" + (user_instr or "")
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+def tm_scope(settings, glossary):
+    return (settings['source_lang'], settings['target_lang'], settings['model_name'], context_hash(glossary, settings['user_instr']))
+
+def tm_key(text): return text.strip()
+
+class TranslationMemory:
+    def __init__(self, path=TM_FILE, max_entries=TM_MAX_ENTRIES):
+        self.path = path; self.max_entries = max_entries
+        self.hits = 0; self.misses = 0
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS tm (src_lang TEXT, tgt_lang TEXT, model TEXT, ctx TEXT, src TEXT, tgt TEXT, used REAL,
+                           PRIMARY KEY (src_lang, tgt_lang, model, ctx, src))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tm_used ON tm (used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS tm_stats (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.commit()
+
+    def lookup(self, scope, texts):
+        """Returns {text: translation} for every cached text and counts hits/misses."""
+        keys = list(dict.fromkeys(tm_key(t) for t in texts if t.strip()))
+        found = {}
+        for i in range(0, len(keys), 500):
+            part = keys[i : i + 500]
+            rows = self.db.execute(f"SELECT src, tgt FROM tm WHERE src_lang=? AND tgt_lang=? AND model=? AND ctx=? AND src IN ({','.join('?' * len(part))})", (*scope, *part))
+            found.update(rows.fetchall())
+        if found:
+            now = time.time()
+            self.db.executemany("UPDATE tm SET used=? WHERE src_lang=? AND tgt_lang=? AND model=? AND ctx=? AND src=?", [(now, *scope, k) for k in found])
+        hits = sum(1 for t in texts if tm_key(t) in found); misses = len(texts) - hits
+        self.hits += hits; self.misses += misses
+        self._bump(hits, misses); self.db.commit()
+        return {t: found[tm_key(t)] for t in texts if tm_key(t) in found}
+
+    def store(self, scope, pairs):
+        rows = [(*scope, tm_key(src), tgt, time.time()) for src, tgt in pairs if src.strip() and tgt.strip()]
+        if not rows: return
+        self.db.executemany("INSERT OR REPLACE INTO tm VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self._evict(); self.db.commit()
+
+    def _evict(self):
+        excess = self.size() - self.max_entries
+        if excess > 0: self.db.execute("DELETE FROM tm WHERE rowid IN (SELECT rowid FROM tm ORDER BY used LIMIT ?)", (excess,))
+
+    def _bump(self, hits, misses):
+        self.db.executemany("INSERT INTO tm_stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", [('hits', hits), ('misses', misses)])
+
+    def size(self): return self.db.execute("SELECT COUNT(*) FROM tm").fetchone()[0]
+
+    def stats(self):
+        totals = dict(self.db.execute("SELECT name, value FROM tm_stats").fetchall())
+        t_hits = totals.get('hits', 0); t_all = t_hits + totals.get('misses', 0); run_all = self.hits + self.misses
+        return {'entries': self.size(), 'max_entries': self.max_entries, 'run_hits': self.hits, 'run_misses': self.misses,
+                'run_hit_rate': self.hits / run_all if run_all else 0.0, 'total_hits': t_hits, 'total_hit_rate': t_hits / t_all if t_all else 0.0}
+
+    def clear(self):
+        self.db.execute("DELETE FROM tm"); self.db.execute("DELETE FROM tm_stats"); self.db.commit()
+
+    def close(self): self.db.close()